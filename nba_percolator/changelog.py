@@ -0,0 +1,129 @@
+"""Buffered change logging for the NBA percolator
+
+Change events (new, update, delete, kill, enrich) are queued and send
+to the elastic search logging cluster in bulk by a background thread,
+so the import does not wait for a request per record.
+"""
+import atexit
+import logging
+import queue
+import threading
+from timeit import default_timer as timer
+from elasticsearch import ElasticsearchException
+from elasticsearch.helpers import bulk
+
+logger = logging.getLogger('nba_percolator')
+
+
+class ChangeLogger:
+    """
+    Queues change events and flushes them with the bulk api when
+    the number of queued events or the time since the last flush
+    passes a threshold. When the queue is full, logging a change
+    blocks until the background thread has caught up.
+    """
+
+    def __init__(self, es, bulkSize=500, flushInterval=5.0, queueSize=10000):
+        self.es = es
+        self.bulkSize = bulkSize
+        self.flushInterval = flushInterval
+
+        self.queue = queue.Queue(maxsize=queueSize)
+        self.flushing = threading.Event()
+        self.stopped = threading.Event()
+
+        self.thread = threading.Thread(target=self.run, name='percolator-changelog', daemon=True)
+        self.thread.start()
+
+        atexit.register(self.close)
+
+    def log(self, index, recid, doc):
+        """
+        Queues a change event, blocks when the queue is full. When
+        the background thread is gone the event is dropped.
+
+        :param index:
+        :param recid:
+        :param doc:
+        """
+        action = {
+            '_index': index,
+            '_type': 'logging',
+            '_id': recid,
+            '_source': doc
+        }
+        while self.thread.is_alive():
+            try:
+                self.queue.put(action, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+        logger.error('Change logging stopped, change of "{recid}" is not logged'.format(recid=recid))
+
+    def flush(self):
+        """
+        Waits until all queued change events are send
+        """
+        self.flushing.set()
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks and self.thread.is_alive():
+                self.queue.all_tasks_done.wait(0.1)
+        self.flushing.clear()
+
+    def close(self):
+        """
+        Flushes the queue and stops the background thread
+        """
+        self.flush()
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        """
+        Background thread, collects change events and sends them
+        in bulk
+        """
+        actions = []
+        lastFlush = timer()
+        while not (self.stopped.is_set() and self.queue.empty()):
+            try:
+                actions.append(self.queue.get(timeout=0.1))
+            except queue.Empty:
+                pass
+
+            if self.flushing.is_set():
+                # drain the backlog in full batches
+                while len(actions) < self.bulkSize:
+                    try:
+                        actions.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+            due = (timer() - lastFlush) >= self.flushInterval
+            if actions and (len(actions) >= self.bulkSize or due or self.flushing.is_set()):
+                try:
+                    self.send(actions)
+                except Exception as err:
+                    # the thread has to go on, otherwise logging blocks forever
+                    logger.error('Failed to log to elastic search: "{error}"'.format(error=err))
+                finally:
+                    for _ in actions:
+                        self.queue.task_done()
+                actions = []
+                lastFlush = timer()
+            elif not actions:
+                lastFlush = timer()
+
+    def send(self, actions):
+        """
+        Sends a list of change events with the bulk api
+
+        :param actions:
+        """
+        try:
+            success, errors = bulk(self.es, actions, raise_on_error=False)
+            if errors:
+                logger.error('Failed to log {count} changes to elastic search'.format(count=len(errors)))
+        except ElasticsearchException as err:
+            logger.error('Failed to log to elastic search: "{error}"'.format(error=err))
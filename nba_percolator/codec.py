@@ -0,0 +1,117 @@
+"""JSON codec for the NBA percolator
+
+Every record is parsed and serialized several times on its way from the
+import table to the delta files. When orjson is installed it is used
+for this, otherwise the standard json module. The json module is used
+with the same compact separators and utf-8 output as orjson, so a delta
+file is byte for byte the same with either backend.
+
+Run ``python -m nba_percolator.codec [jsonlines file]`` for a
+benchmark of both.
+"""
+import json
+import sys
+from timeit import default_timer as timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+
+# the output of orjson
+SEPARATORS = (',', ':')
+
+
+def loads(data):
+    """
+    Parses a json string (or bytes)
+
+    :param data:
+    :return:
+    """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """
+    Serializes an object to a json string
+
+    :param obj:
+    :return str:
+    """
+    if orjson:
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            # orjson is strict on keys and (big) integers, json is not
+            pass
+    return json.dumps(obj, separators=SEPARATORS, ensure_ascii=False)
+
+
+def dump(obj, fp):
+    """
+    Serializes an object as json to a (text) file
+
+    :param obj:
+    :param fp:
+    """
+    fp.write(dumps(obj))
+
+
+def benchmark(lines, rounds=5):
+    """
+    Measures parsing and serializing of json lines with the json
+    module and the fast backend
+
+    :param lines:
+    :param rounds:
+    :return dict: microseconds per record per backend
+    """
+    backends = {'json': (json.loads, json.dumps)}
+    if orjson:
+        backends['orjson'] = (loads, dumps)
+
+    results = {}
+    for name, (parse, serialize) in backends.items():
+        start = timer()
+        for _ in range(rounds):
+            for line in lines:
+                serialize(parse(line))
+        results[name] = (timer() - start) * 1000000 / (rounds * len(lines))
+
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'r', encoding='utf-8') as f:
+            lines = [line for line in f.read().splitlines() if line][:10000]
+    else:
+        record = {
+            'id': 'L.1234567@CRS',
+            'unitID': 'L.1234567',
+            'sourceSystem': {'code': 'CRS', 'name': 'Naturalis - Botany catalogues'},
+            'gatheringEvent': {'localityText': 'Nederland, Leiden', 'dateTimeBegin': '1921-06-01T00:00:00+0000'},
+            'identifications': [{
+                'preferred': True,
+                'scientificName': {
+                    'fullScientificName': 'Bellis perennis L.',
+                    'scientificNameGroup': 'bellis perennis',
+                    'genusOrMonomial': 'Bellis',
+                    'specificEpithet': 'perennis'
+                },
+                'defaultClassification': {'kingdom': 'Plantae', 'family': 'Asteraceae', 'genus': 'Bellis'},
+                'vernacularNames': [{'name': 'madeliefje', 'language': 'Dutch', 'preferred': True}]
+            }]
+        }
+        lines = [json.dumps(record)] * 1000
+
+    results = benchmark(lines)
+    for name, microseconds in results.items():
+        print('{name:>8}: {microseconds:.2f} us per record'.format(name=name, microseconds=microseconds))
+    if 'orjson' in results:
+        print(' speedup: {speedup:.1f}x'.format(speedup=results['json'] / results['orjson']))
@@ -0,0 +1,112 @@
+"""Reading of (compressed) jsonlines data files
+
+Data files can be read by the percolator process itself, so they can
+be streamed to a database server without access to the shared data
+directory. Gzip (.gz) and zstandard (.zst) compressed files are
+decompressed while reading.
+"""
+import gzip
+import logging
+import os
+from timeit import default_timer as timer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('nba_percolator')
+
+COMPRESSIONS = ('.gz', '.zst')
+
+
+def is_compressed(path):
+    """
+    Checks if a data file is compressed, based on the extension
+
+    :param path:
+    :return bool:
+    """
+    return path.endswith(COMPRESSIONS)
+
+
+def strip_compression(filename):
+    """
+    Removes the compression extension of a filename
+
+    :param filename:
+    :return:
+    """
+    for extension in COMPRESSIONS:
+        if filename.endswith(extension):
+            return filename[:-len(extension)]
+    return filename
+
+
+def strip_extension(filename):
+    """
+    Removes the compression and json extensions of a filename
+
+    :param filename:
+    :return:
+    """
+    return strip_compression(filename).replace('.json', '')
+
+
+class DataFile:
+    """
+    Binary reader for a (compressed) data file, it logs the progress
+    of reading at a fixed interval.
+    """
+
+    def __init__(self, path, interval=10):
+        self.path = path
+        self.interval = interval
+        self.size = os.path.getsize(path)
+        self.bytesRead = 0
+
+        self.raw = open(path, 'rb')
+        if path.endswith('.gz'):
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='rb')
+        elif path.endswith('.zst'):
+            if zstandard is None:
+                self.raw.close()
+                raise ImportError('Reading "{path}" needs the zstandard module'.format(path=path))
+            self.stream = zstandard.ZstdDecompressor().stream_reader(self.raw)
+        else:
+            self.stream = self.raw
+
+        self.start = self.lap = timer()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytesRead += len(data)
+
+        if timer() - self.lap >= self.interval:
+            self.log_progress()
+            self.lap = timer()
+
+        return data
+
+    def log_progress(self):
+        # the position in the (compressed) file gives the percentage
+        position = self.raw.tell()
+        logger.info(
+            '[{elapsed:.2f} seconds] Read {megabytes:.0f} MB of "{path}" ({percentage:.1f}%)'.format(
+                elapsed=(timer() - self.start),
+                megabytes=self.bytesRead / 1048576,
+                path=self.path,
+                percentage=(100.0 * position / self.size) if self.size else 100.0
+            )
+        )
+
+    def close(self):
+        if self.stream is not self.raw:
+            self.stream.close()
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,182 @@
+"""Writing of (compressed, sharded) delta files
+
+A delta writer is used as a text file by the percolator. The output can
+be compressed with gzip or zstandard, and it is rotated to a new shard
+after a number of records or (uncompressed) bytes. Every shard is
+registered with its record count, size and checksum, so a manifest of
+all delta files of a job can be handed to the infuser.
+
+Shards are written under a temporary name, the percolator renames them
+when the job is finished.
+"""
+import gzip
+import hashlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {
+    'none': '',
+    'gzip': '.gz',
+    'zstd': '.zst'
+}
+
+
+def temporary_path(path):
+    """
+    Returns the temporary path of a shard that is being written
+
+    :param path:
+    :return str:
+    """
+    return path + '.tmp'
+
+
+def shard_path(base, number, compression='none'):
+    """
+    Returns the path of a shard, the first shard has no number
+
+    :param base: path without extension
+    :param number:
+    :param compression:
+    :return str:
+    """
+    if number:
+        base = '{base}-shard{number}'.format(base=base, number=number)
+    return base + '.json' + EXTENSIONS.get(compression, '')
+
+
+def manifest(shards):
+    """
+    Returns the manifest of registered shards
+
+    :param shards: registry of shards by path
+    :return list:
+    """
+    entries = []
+    for info in shards.values():
+        entry = dict((key, value) for key, value in info.items() if key != 'hash')
+        if info.get('hash'):
+            entry['sha256'] = info['hash'].hexdigest()
+        entries.append(entry)
+    return entries
+
+
+class ShardFile:
+    """
+    Binary file of a shard, which counts and hashes the bytes that
+    are written to disk. A shard is appended to only when it is
+    reopened in the same job, a temporary file left by an earlier
+    run is overwritten.
+    """
+
+    def __init__(self, path, info, bufferSize=1048576, append=False):
+        self.raw = open(temporary_path(path), 'ab' if append else 'wb', buffering=bufferSize)
+        self.info = info
+
+    def write(self, data):
+        self.raw.write(data)
+        self.info['bytes'] += len(data)
+        self.info['hash'].update(data)
+        return len(data)
+
+    def flush(self):
+        self.raw.flush()
+
+    def close(self):
+        self.raw.close()
+
+
+class DeltaWriter:
+    """
+    Text file like writer of delta records. Records are written as
+    lines, a new shard is only started after a complete line.
+    """
+
+    def __init__(self, base, shards, index='unknown', action='new', compression='none',
+                 maxRecords=0, maxBytes=0, bufferSize=1048576):
+        if compression not in EXTENSIONS:
+            raise ValueError('Unknown delta compression "{compression}"'.format(compression=compression))
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('Writing zstd compressed delta files needs the zstandard module')
+
+        self.base = base
+        self.shards = shards
+        self.index = index
+        self.action = action
+        self.compression = compression
+        self.maxRecords = maxRecords
+        self.maxBytes = maxBytes
+        self.bufferSize = bufferSize
+
+        # continue with the last shard of a delta file that was written before
+        number = 0
+        while shard_path(base, number + 1, compression) in shards:
+            number += 1
+
+        self.name = shard_path(base, 0, compression)
+        self.file = None
+        self.stream = None
+        self.info = None
+        self.open_shard(number)
+        if self.is_full():
+            self.close_shard()
+
+    def is_full(self):
+        return (self.maxRecords and self.info['count'] >= self.maxRecords) or \
+               (self.maxBytes and self.info['size'] >= self.maxBytes)
+
+    def open_shard(self, number):
+        path = shard_path(self.base, number, self.compression)
+        self.info = self.shards.get(path)
+        append = self.info is not None
+        if not append:
+            self.info = {
+                'file': path,
+                'index': self.index,
+                'action': self.action,
+                'shard': number,
+                'compression': self.compression,
+                'count': 0,
+                'size': 0,
+                'bytes': 0,
+                'hash': hashlib.sha256()
+            }
+            self.shards[path] = self.info
+
+        self.file = ShardFile(path, self.info, self.bufferSize, append=append)
+        if self.compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.file, mode='wb')
+        elif self.compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.file)
+        else:
+            self.stream = self.file
+
+    def close_shard(self):
+        if self.compression == 'gzip':
+            self.stream.close()
+        elif self.compression == 'zstd':
+            self.stream.flush(zstandard.FLUSH_FRAME)
+        self.file.close()
+        self.file = None
+
+    def write(self, text):
+        if self.file is None:
+            # the next shard is opened when there is something to write
+            self.open_shard(self.info['shard'] + 1)
+
+        data = text.encode('utf-8')
+        self.stream.write(data)
+        self.info['size'] += len(data)
+        self.info['count'] += data.count(b'\n')
+
+        if self.is_full() and data.endswith(b'\n'):
+            self.close_shard()
+
+        return len(text)
+
+    def close(self):
+        if self.file is not None:
+            self.close_shard()
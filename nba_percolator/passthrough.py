@@ -0,0 +1,49 @@
+"""Passthrough of records from postgres to delta files
+
+Records that are not enriched are written to the delta files as they
+are stored in the database. The rows are streamed with COPY ... TO
+STDOUT in csv format, with control characters as delimiter and quote.
+Those never occur unescaped in the text of a jsonb value, so every row
+is the id and the json text of a record, without any quoting.
+"""
+
+DELIMITER = '\x02'
+QUOTE = '\x01'
+
+
+def copy_query(query):
+    """
+    Wraps a query, which selects the record id and the record, in a
+    COPY statement for a Passthrough
+
+    :param query:
+    :return str:
+    """
+    return "COPY ({query}) TO STDOUT WITH (FORMAT csv, DELIMITER E'\\x02', QUOTE E'\\x01')".format(
+        query=query
+    )
+
+
+class Passthrough:
+    """
+    File like object for copy_expert, it writes the json text of every
+    copied row as a line to the delta file and collects the record ids
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.ids = []
+        self.rest = ''
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+
+        lines = (self.rest + data).split('\n')
+        self.rest = lines.pop()
+        for line in lines:
+            recid, rec = line.split(DELIMITER, 1)
+            if rec:
+                self.ids.append(recid)
+                self.fp.write(rec)
+                self.fp.write('\n')
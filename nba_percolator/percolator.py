@@ -3,27 +3,50 @@
 This module contains all the database dependencies and functions used
 for importing new and updated data into the NBA document store.
 """
+import copy
+import hashlib
 import json
 import logging
+import multiprocessing
 import os
+import re
 import glob
 import shutil
+import signal
 import sys
 import requests
+import tempfile
 import time
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 from timeit import default_timer as timer
 from elasticsearch import Elasticsearch, ElasticsearchException, ConnectionError, TransportError
 from pony.orm import db_session
 from dateutil import parser
-from diskcache import Cache
 from .schema import *
+from . import codec
+from .changelog import ChangeLogger
+from .passthrough import Passthrough, copy_query
+from .statements import Statements
+from .taxoncache import TaxonCache
+from .datafile import DataFile, is_compressed, strip_compression, strip_extension
+from .deltawriter import DeltaWriter, manifest, temporary_path
 
 logger = logging.getLogger('nba_percolator')
 
-# Caching on disk (diskcache) using sqlite, it should be fast
-cache = Cache('/tmp/percolator_cache')
-cache.clear()
+# Caching in memory, in front of caching on disk (diskcache) using sqlite,
+# the disk cache is opened with the configured settings and kept between runs
+cache = TaxonCache()
+
+
+def enabled(value):
+    """
+    Checks if a yes/no config value is enabled
+
+    :param value:
+    :return bool:
+    """
+    return str(value).lower() in ('yes', 'true', '1')
 
 
 # noinspection SqlNoDataSourceInspection,SqlResolve,PyTypeChecker,PyUnresolvedReferences,SpellCheckingInspection
@@ -63,6 +86,8 @@ class Percolator:
             sys.exit(msg)
 
         self.es = self.connect_to_elastic()
+        self.changeLogger = self.create_changelogger()
+        self.statements = Statements()
         self.connect_to_database()
 
         self.jobDate = datetime.now()
@@ -78,12 +103,24 @@ class Percolator:
         self.supplier = ''
         self.filename = ''
         self.deltafiles = []
+        self.deltaShards = {}
+        self.deltaWriters = {}
         self.noslack = False
         self.elastic_logging = True
+        self.partition = None
+        self.impacted = {}
 
         self.paths = self.config.get('paths')
         self.sourceConfig = {}
 
+        cacheConfig = self.config.get('cache') or {}
+        cache.size = int(cacheConfig.get('memory-size', 100000))
+        cache.open(
+            directory=self.get_cache_directory(),
+            sizeLimit=int(cacheConfig.get('size-limit', 2 ** 30)),
+            evictionPolicy=cacheConfig.get('eviction-policy', 'least-recently-used')
+        )
+
         self.delta_writable_test()
 
     def set_nologging(self):
@@ -165,6 +202,80 @@ class Percolator:
             self.slack('*Percolator* failed: {msg}'.format(msg=msg))
             sys.exit(msg)
 
+    def create_changelogger(self):
+        """
+        Creates the buffered change logger, when enabled in the
+        elastic part of the config
+
+        :return ChangeLogger or None:
+        """
+        elasticConfig = self.config.get('elastic') or {}
+        if not enabled(elasticConfig.get('buffered', 'no')):
+            return None
+
+        return ChangeLogger(
+            self.es,
+            bulkSize=int(elasticConfig.get('bulk-size', 500)),
+            flushInterval=float(elasticConfig.get('flush-interval', 5)),
+            queueSize=int(elasticConfig.get('queue-size', 10000))
+        )
+
+    def get_log_index(self):
+        """
+        Name of the logging index, by default an index per job. A
+        rolling index can be configured as a date pattern in the
+        elastic part of the config, e.g. 'percolator-%Y.%m'.
+
+        :return:
+        """
+        elasticConfig = self.config.get('elastic') or {}
+        pattern = elasticConfig.get('index')
+        if pattern:
+            return datetime.now().strftime(pattern).lower()
+        return self.jobId.lower()
+
+    def get_database_settings(self):
+        """
+        Returns the user, password, host and name of the database,
+        from the config or else from the environment
+
+        :return tuple:
+        """
+        if self.config.get('postgres'):
+            return (
+                self.config.get('postgres').get('user'),
+                self.config.get('postgres').get('pass'),
+                self.config.get('postgres').get('host'),
+                self.config.get('postgres').get('db')
+            )
+
+        return (
+            os.environ.get('DATABASE_USER'),
+            os.environ.get('DATABASE_PASSWORD'),
+            os.environ.get('DATABASE_HOST'),
+            os.environ.get('DATABASE_DB')
+        )
+
+    def get_cache_directory(self):
+        """
+        Returns the directory of the taxon disk cache. By default
+        every database has its own directory, so percolators of a
+        test and a production database on the same host do not
+        share cached taxa.
+
+        :return str:
+        """
+        cacheConfig = self.config.get('cache') or {}
+        if cacheConfig.get('directory'):
+            return cacheConfig.get('directory')
+
+        user, password, host, database = self.get_database_settings()
+        return os.path.join(
+            tempfile.gettempdir(),
+            'percolator_cache',
+            re.sub(r'[^\w.-]', '_', '{host}-{database}'.format(host=host or 'localhost', database=database))
+        )
+
     def connect_to_database(self):
         """
         Connects to postgres database
@@ -175,15 +286,7 @@ class Percolator:
 
         self.db = db
 
-        user = os.environ.get('DATABASE_USER')
-        password = os.environ.get('DATABASE_PASSWORD')
-        host = os.environ.get('DATABASE_HOST')
-        database = os.environ.get('DATABASE_DB')
-        if self.config.get('postgres'):
-            user = self.config.get('postgres').get('user')
-            password = self.config.get('postgres').get('pass')
-            database = self.config.get('postgres').get('db')
-            host = self.config.get('postgres').get('host')
+        user, password, host, database = self.get_database_settings()
 
         try:
             self.db.bind(
@@ -217,9 +320,128 @@ class Percolator:
             self.slack('*Percolator* failed: {msg}'.format(msg=msg))
             sys.exit(msg)
 
+        self.upgrade_database()
+
+    @db_session
+    def upgrade_database(self):
+        """
+        Adds the database objects the percolator relies on, which
+        databases created by older versions do not have yet. This
+        runs once at setup, not in the import paths.
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                # the bulk deletes upsert on recid, older databases only have a plain index
+                cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS unq_deleted_records__recid '
+                               'ON deleted_records (recid)')
+
+                # hashes records while loading (see set_hash_trigger), created once
+                # because replacing it from concurrent lanes conflicts
+                cursor.execute(
+                    "CREATE OR REPLACE FUNCTION percolator_hash() RETURNS trigger AS $$ "
+                    "DECLARE "
+                    "hashed jsonb := NEW.rec; "
+                    "path text; "
+                    "BEGIN "
+                    "IF NEW.hash IS NULL THEN "
+                    "IF TG_NARGS > 0 THEN "
+                    "FOREACH path IN ARRAY TG_ARGV LOOP "
+                    "hashed := hashed #- path::text[]; "
+                    "END LOOP; "
+                    "END IF; "
+                    "NEW.hash := md5(hashed::text); "
+                    "END IF; "
+                    "RETURN NEW; "
+                    "END "
+                    "$$ LANGUAGE plpgsql"
+                )
+
+                # generations of the taxon sources (see bump_generation)
+                cursor.execute('CREATE TABLE IF NOT EXISTS taxon_generations ('
+                               'source text PRIMARY KEY, '
+                               'generation integer NOT NULL DEFAULT 0)')
+
+                # random identity of the database for the keys of the taxon cache,
+                # a recreated database gets a new one
+                cursor.execute('CREATE TABLE IF NOT EXISTS percolator_database ('
+                               'id integer PRIMARY KEY DEFAULT 1 CHECK (id = 1), '
+                               'identity text NOT NULL)')
+                cursor.execute('INSERT INTO percolator_database (identity) '
+                               'VALUES (md5(random()::text || clock_timestamp()::text)) '
+                               'ON CONFLICT (id) DO NOTHING')
+                cursor.execute('SELECT identity FROM percolator_database')
+                cache.set_database(cursor.fetchone()[0])
+
+    @db_session
+    def load_generations(self):
+        """
+        Reads the generations of the taxon sources, they are part
+        of the keys of the taxon cache. A database without the
+        generations table has no generations yet.
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT to_regclass('taxon_generations')")
+                if cursor.fetchone()[0] is None:
+                    return
+
+                cursor.execute('SELECT source, generation FROM taxon_generations')
+                generations = cursor.fetchall()
+
+        for source, generation in generations:
+            cache.set_generation(source, generation)
+
+    @db_session
+    def bump_generation(self):
+        """
+        Raises the generation of the current source when it is a
+        taxon source (it enriches other sources). Cached taxa of
+        the previous state of the current table are not used anymore.
+        """
+        if not (self.sourceConfig.get('enriches') or self.sourceConfig.get('dst-enrich')):
+            return
+
+        code = self.sourceConfig.get('code')
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO taxon_generations (source, generation) VALUES (%s, 1) '
+                    'ON CONFLICT (source) DO UPDATE SET generation = taxon_generations.generation + 1 '
+                    'RETURNING generation',
+                    (code,)
+                )
+                generation = cursor.fetchone()[0]
+
+        cache.set_generation(code, generation)
+        logger.debug('Taxon cache generation of "{code}" is {generation}'.format(
+            code=code,
+            generation=generation
+        ))
+
     def is_incremental(self):
         return self.sourceConfig.get('incremental', 'yes') == 'yes'
 
+    def get_setting(self, key, default=None):
+        """
+        Gets a setting from the source config, when the source does
+        not specify it the global setting in the config is used
+
+        :param key:
+        :param default:
+        :return:
+        """
+        return self.sourceConfig.get(key, self.config.get(key, default))
+
+    def is_enabled(self, key, default='no'):
+        """
+        Checks if a yes/no setting is enabled (see get_setting)
+
+        :param key:
+        :param default:
+        :return bool:
+        """
+        return enabled(self.get_setting(key, default))
+
     def lock(self, jobFile):
         """
         Generates a locking file
@@ -288,6 +510,36 @@ class Percolator:
 
         return False
 
+    def reset_job(self):
+        """
+        Resets the results of the previous job, a daemon handles all
+        jobs with the same percolator
+        """
+        # writers left open by a failed job, their files are never published
+        for deltaFile in self.deltaWriters.values():
+            deltaFile.close()
+
+        self.jobDate = datetime.now()
+        self.job = False
+        self.jobId = ''
+        self.supplier = ''
+        self.filename = ''
+        self.tabulaRasa = False
+        self.percolatorMeta = {}
+        self.deltafiles = []
+        self.deltaShards = {}
+        self.deltaWriters = {}
+        self.impacted = {}
+
+    def close(self):
+        """
+        Closes the logging, cache and database connections
+        """
+        if self.changeLogger:
+            self.changeLogger.close()
+        cache.close()
+        self.db.disconnect()
+
     def parse_job(self, jsonData='{}'):
         """
         Parse a json job file, and tries to retrieve the validated
@@ -345,6 +597,8 @@ class Percolator:
         """
         global cache
 
+        self.reset_job()
+
         files = None
         with open(jobFile, "r") as fp:
             jsonData = fp.read()
@@ -358,6 +612,11 @@ class Percolator:
         self.lock(jobFile)
         self.slack('*Percolator* started `{job}`'.format(job=jobFile))
 
+        self.load_generations()
+        cache.reset_statistics()
+        if enabled((self.config.get('cache') or {}).get('preload', 'no')):
+            self.preload_taxa()
+
         # import each file
         if len(files['imports']):
             self.process_importfiles(files['imports'])
@@ -365,6 +624,9 @@ class Percolator:
         if len(files['deletes']):
             self.process_deletefiles(files['deletes'])
 
+        # records impacted by taxon changes are enriched once for the whole job
+        self.process_impacted()
+
         # everything is finished and okay, remove the lock
         self.finish_job()
 
@@ -372,29 +634,170 @@ class Percolator:
 
     def process_importfiles(self, files):
         """
-        Takes each import file and does an import
+        Takes each import file and does an import. When more than
+        one worker is configured, independent sources are imported
+        at the same time (see process_importfiles_parallel).
 
         :param files:
         """
+        workers = int(self.config.get('workers', 1))
+        if workers > 1 and len(files) > 1:
+            self.process_importfiles_parallel(files, workers)
+            return
+
         for source, filenames in files.items():
-            for filename in filenames:
-                self.filename = filename
-                self.set_source(source.lower())
+            self.process_sourcefiles(source, filenames)
 
-                filePath = self.get_path('incoming', filename)
+    def process_sourcefiles(self, source, filenames):
+        """
+        Imports the files of a single source
 
-                self.set_metainfo(key='in', value=filePath, source=source.lower(), filename=filename)
+        :param source:
+        :param filenames:
+        """
+        for filename in filenames:
+            self.filename = filename
+            self.set_source(source.lower())
 
-                #
-                # self.log_change(
-                #    state='import',
-                #    comment='{filepath}'.format(filepath=filePath)
-                # )
+            filePath = self.get_path('incoming', filename)
 
-                if self.tabulaRasa:
-                    self.tabularasa_import(filename, source)
-                else:
-                    self.normal_import(filename, source)
+            self.set_metainfo(key='in', value=filePath, source=source.lower(), filename=filename)
+
+            #
+            # self.log_change(
+            #    state='import',
+            #    comment='{filepath}'.format(filepath=filePath)
+            # )
+
+            if self.tabulaRasa:
+                self.tabularasa_import(filename, source)
+            else:
+                self.normal_import(filename, source)
+
+    def plan_lanes(self, sources):
+        """
+        Divides the sources of a job in lanes that can be processed
+        independently. Sources that enrich each other, or that write
+        to the same index, end up in the same lane. Within a lane the
+        sources that feed other sources come first. Only enrichment
+        between sources of the job counts.
+
+        :param sources: list of source names
+        :return list: list of lanes, each a list of source names
+        """
+        parents = {}
+
+        def find(name):
+            parents.setdefault(name, name)
+            while parents[name] != name:
+                parents[name] = parents[parents[name]]
+                name = parents[name]
+            return name
+
+        def join(name, other):
+            parents[find(name)] = find(other)
+
+        # sources that are not part of the job do not tie sources together
+        names = set(source.lower() for source in sources)
+
+        feeding = set()
+        for source in sources:
+            sourceConfig = self.config.get('sources').get(source.lower(), {})
+            for destination in (sourceConfig.get('enriches') or []) + (sourceConfig.get('dst-enrich') or []):
+                if destination in names:
+                    join(source.lower(), destination)
+                    feeding.add(source.lower())
+            for enrichSource in sourceConfig.get('src-enrich') or []:
+                if enrichSource in names:
+                    join(source.lower(), enrichSource)
+                    feeding.add(enrichSource)
+            if sourceConfig.get('index'):
+                join(source.lower(), 'index:' + sourceConfig.get('index'))
+            else:
+                find(source.lower())
+
+        lanes = {}
+        for source in sources:
+            lanes.setdefault(find(source.lower()), []).append(source)
+
+        return [
+            sorted(lane, key=lambda name: name.lower() not in feeding)
+            for lane in lanes.values()
+        ]
+
+    def create_worker(self):
+        """
+        Creates a copy of the percolator, which shares the config and
+        connections, but keeps its own source and job results
+
+        :return Percolator:
+        """
+        worker = copy.copy(self)
+        worker.percolatorMeta = {}
+        worker.deltafiles = []
+        worker.deltaShards = {}
+        worker.deltaWriters = {}
+        worker.sourceConfig = {}
+        worker.impacted = {}
+
+        return worker
+
+    def merge_worker(self, worker):
+        """
+        Merges the job results of a worker
+
+        :param worker:
+        """
+        for source, meta in worker.percolatorMeta.items():
+            if isinstance(meta, dict) and isinstance(self.percolatorMeta.get(source), dict):
+                self.percolatorMeta[source].update(meta)
+            else:
+                self.percolatorMeta[source] = meta
+
+        for filepath in worker.deltafiles:
+            self.add_deltafile(filepath)
+
+        # sources writing to the same index are in the same lane
+        self.deltaShards.update(worker.deltaShards)
+        self.deltaWriters.update(worker.deltaWriters)
+
+        self.merge_impacted(worker.impacted)
+
+    def merge_impacted(self, impacted):
+        """
+        Merges the impacted scientificNameGroups of a worker
+
+        :param impacted:
+        """
+        for source, scientificNameGroups in impacted.items():
+            self.impacted.setdefault(source, set()).update(scientificNameGroups)
+
+    def process_importfiles_parallel(self, files, workers):
+        """
+        Imports the sources of a job in parallel, each lane of sources
+        (see plan_lanes) is handled by a worker thread with its own
+        database connection.
+
+        :param files:
+        :param workers:
+        """
+        lanes = self.plan_lanes(list(files.keys()))
+        logger.info('Processing {sources} sources in {lanes} lanes with {workers} workers'.format(
+            sources=len(files),
+            lanes=len(lanes),
+            workers=workers
+        ))
+
+        def process_lane(lane):
+            worker = self.create_worker()
+            for source in lane:
+                worker.process_sourcefiles(source, files[source])
+            return worker
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_lane, lane) for lane in lanes]
+            for future in futures:
+                self.merge_worker(future.result())
 
     def normal_import(self, filename, source):
         """
@@ -429,34 +832,173 @@ class Percolator:
         :param filename:
         :param source:
         """
-        global cache
-
         filePath = self.get_path('incoming', filename)
 
-        self.clear_data(self.sourceConfig.get('table') + '_current')
-        self.import_data(self.sourceConfig.get('table') + '_current', datafile=filePath)
-        self.remove_doubles(suffix='current')
-        self.set_indexes(self.sourceConfig.get('table') + '_current')
+        if self.is_enabled('staging'):
+            self.staged_import(datafile=filePath)
+        else:
+            self.clear_data(self.sourceConfig.get('table') + '_current')
+            self.import_data(self.sourceConfig.get('table') + '_current', datafile=filePath)
+            self.remove_doubles(suffix='current')
+            self.set_indexes(self.sourceConfig.get('table') + '_current')
 
         # copy the data straight to the import
-        outputPath = self.get_path('delta', filename)
+        outputPath = self.get_path('delta', strip_compression(filename))
 
         self.add_deltafile(outputPath)
+        self.bump_generation()
+
+        # written under a temporary name, so it is published at once
+        tempPath = temporary_path(outputPath)
         enrichSources = self.sourceConfig.get('src-enrich', None)
         if enrichSources:
-            cache.clear()
-            with open(file=outputPath, mode='w') as outputFile:
+            with open(file=tempPath, mode='w', encoding='utf-8') as outputFile:
                 self.export_records(fp=outputFile)
                 logger.debug('Creating an enriched export file: "{file}"'.format(file=outputPath))
+        elif is_compressed(filePath):
+            with DataFile(filePath) as inputFile, open(file=tempPath, mode='wb') as outputFile:
+                shutil.copyfileobj(inputFile, outputFile, 1048576)
+            logger.debug('Decompress the import file: "{file}"'.format(file=outputPath))
         else:
-            shutil.copy(filePath, outputPath)
+            shutil.copy(filePath, tempPath)
             logger.debug('Copy the import file: "{file}"'.format(file=outputPath))
+        os.replace(tempPath, outputPath)
 
         # move the import data
         processedPath = self.get_path('processed', filename)
         self.set_metainfo(key='out', value=processedPath, source=source.lower(), filename=filename)
         shutil.move(filePath, processedPath)
 
+    def staged_import(self, datafile=''):
+        """
+        Imports a complete data file into an unlogged shadow table
+        of the current table. When the shadow table is loaded and
+        indexed it replaces the current table, so the current table
+        is never empty or half built.
+
+        :param datafile:
+        """
+        table = self.sourceConfig.get('table') + '_current'
+        staging = table + '_staging'
+
+        self.create_staging_table(table=table, staging=staging)
+        self.import_data(staging, datafile=datafile)
+        self.remove_doubles(suffix='current_staging')
+        self.swap_table(table=table, staging=staging)
+
+    @db_session
+    def create_staging_table(self, table='', staging=''):
+        """
+        Creates an empty unlogged shadow table with the same columns
+        as the table
+
+        :param table:
+        :param staging:
+        """
+        self.db.execute('DROP TABLE IF EXISTS public.{staging}'.format(staging=staging))
+        self.db.execute(
+            'CREATE UNLOGGED TABLE public.{staging} '
+            '(LIKE public.{table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'.format(
+                table=table,
+                staging=staging
+            )
+        )
+        logger.debug('Created staging table "{staging}"'.format(staging=staging))
+
+    def swap_table(self, table='', staging=''):
+        """
+        Replaces the table by the (loaded and indexed) shadow table.
+        The shadow table is made durable first, after that the swap
+        itself is a rename inside a single short transaction.
+
+        :param table:
+        :param staging:
+        """
+        lap = timer()
+        self.make_durable(table=table, staging=staging)
+        logger.debug('[{elapsed:.2f} seconds] Staging table "{staging}" is logged'.format(
+            staging=staging,
+            elapsed=(timer() - lap)
+        ))
+        lap = timer()
+        self.rename_staging_table(table=table, staging=staging)
+        logger.debug('[{elapsed:.2f} seconds] Swapped "{staging}" into "{table}"'.format(
+            table=table,
+            staging=staging,
+            elapsed=(timer() - lap)
+        ))
+
+    @db_session
+    def make_durable(self, table='', staging=''):
+        """
+        Adds the primary key and makes the shadow table logged
+
+        :param table:
+        :param staging:
+        """
+        self.db.execute(
+            'ALTER TABLE public.{staging} ADD CONSTRAINT {staging}_pkey PRIMARY KEY (id)'.format(staging=staging)
+        )
+        self.db.execute('ALTER TABLE public.{staging} SET LOGGED'.format(staging=staging))
+
+    @db_session
+    def rename_staging_table(self, table='', staging=''):
+        """
+        Drops the table and renames the shadow table (with its
+        indexes) to take its place, the id sequence is handed over
+        to the shadow table.
+
+        :param table:
+        :param staging:
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('LOCK TABLE public.{table} IN ACCESS EXCLUSIVE MODE'.format(table=table))
+                cursor.execute("SELECT pg_get_serial_sequence('public.{table}', 'id')".format(table=table))
+                sequence = cursor.fetchone()[0]
+                if sequence:
+                    cursor.execute('ALTER SEQUENCE {sequence} OWNED BY public.{staging}.id'.format(
+                        sequence=sequence,
+                        staging=staging
+                    ))
+
+                cursor.execute(
+                    "SELECT indexname FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s",
+                    (staging,)
+                )
+                indexes = [row[0] for row in cursor.fetchall()]
+
+                cursor.execute('DROP TABLE public.{table}'.format(table=table))
+                cursor.execute('ALTER TABLE public.{staging} RENAME TO {table}'.format(
+                    table=table,
+                    staging=staging
+                ))
+                for indexName in indexes:
+                    if indexName.startswith('idx_' + staging + '__') or indexName == staging + '_pkey':
+                        cursor.execute('ALTER INDEX public.{index} RENAME TO {newindex}'.format(
+                            index=indexName,
+                            newindex=indexName.replace(staging, table, 1)
+                        ))
+
+    @db_session
+    def set_unlogged(self, table=''):
+        """
+        Makes a table unlogged, this is meant for the import tables
+        which are rebuilt on every run and do not need to survive a
+        crash
+
+        :param table:
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT relpersistence FROM pg_class WHERE oid = 'public.{table}'::regclass".format(table=table)
+                )
+                row = cursor.fetchone()
+                if row and row[0] == 'p':
+                    cursor.execute('ALTER TABLE public.{table} SET UNLOGGED'.format(table=table))
+                    logger.debug('Table "{table}" is now unlogged'.format(table=table))
+
     def process_deletefiles(self, files):
         """
         Process the file with deleted records
@@ -484,8 +1026,19 @@ class Percolator:
         self.unlock()
         infuserJobFile = self.get_path('done', self.jobId + '.json')
 
+        # make sure all changes are logged before the job is done
+        if self.changeLogger:
+            self.changeLogger.flush()
+
+        self.publish_deltafiles()
+        if len(self.deltaShards):
+            # the infuser can load the shards of the manifest in parallel
+            self.percolatorMeta['manifest'] = manifest(self.deltaShards)
+            for entry in self.percolatorMeta['manifest']:
+                self.add_deltafile(entry.get('file'))
         if len(self.deltafiles):
             self.percolatorMeta['outfiles'] = self.deltafiles
+        self.percolatorMeta['taxoncache'] = cache.statistics()
         self.job['percolator'] = self.percolatorMeta
 
         self.slack('*Percolator* finished `{job}` ```{json}```'.format(
@@ -523,38 +1076,92 @@ class Percolator:
         #    sys.exit(msg)
         return True
 
+    def get_delta_settings(self):
+        """
+        Returns the compression and rotation settings of the delta
+        files, from the delta section of the config
+
+        :return dict:
+        """
+        deltaConfig = self.config.get('delta') or {}
+        return {
+            'compression': deltaConfig.get('compression', 'none'),
+            'maxRecords': int(deltaConfig.get('shard-records', 0)),
+            'maxBytes': int(deltaConfig.get('shard-bytes', 0)),
+            'bufferSize': int(deltaConfig.get('buffer-size', 1048576))
+        }
+
     def open_deltafile(self, action='new', index='unknown'):
         """
-        Open the delta file for updated, new or deleted records
+        Open the delta file for updated, new or deleted records. The
+        delta writer can compress the records and rotate to a new
+        shard, every shard is registered for the manifest of the job.
+
+        There is one writer per index and action, which stays open
+        until the delta files are published (see publish_deltafiles).
         """
+        deltaFile = self.deltaWriters.get((index, action))
+        if deltaFile:
+            return deltaFile
+
         if not self.jobId:
-            filename = "{ts}-{index}-{action}.json".format(
+            filename = "{ts}-{index}-{action}".format(
                 index=index,
                 ts=time.strftime('%Y%m%d%H%M%S'),
                 action=action
             )
         else:
-            filename = "{jobid}-{index}-{action}.json".format(
+            filename = "{jobid}-{index}-{action}".format(
                 jobid=self.jobId,
                 index=index,
                 action=action
             )
+        if self.partition is not None:
+            # partial delta files are merged by the main process
+            filename += '-part{number}'.format(number=self.partition[0])
         filePath = self.get_path('delta', filename)
 
         try:
-            deltaFile = open(filePath, 'a')
+            deltaFile = DeltaWriter(filePath, self.deltaShards, index=index, action=action,
+                                    **self.get_delta_settings())
         except Exception:
             msg = 'Unable to write to "{filepath}"'.format(filepath=filePath)
             logger.fatal(msg)
             self.slack('*Percolator* failed: {msg}'.format(msg=msg))
             sys.exit(msg)
 
-        self.add_deltafile(filePath)
-
-        logger.debug(filePath + ' opened')
+        logger.debug(deltaFile.name + ' opened')
+        self.deltaWriters[(index, action)] = deltaFile
 
         return deltaFile
 
+    def close_deltafile(self, index, action):
+        """
+        Closes the delta writer of an index and action, the delta
+        file is published with the others
+
+        :param index:
+        :param action:
+        """
+        deltaFile = self.deltaWriters.pop((index, action), None)
+        if deltaFile:
+            deltaFile.close()
+
+    def publish_deltafiles(self):
+        """
+        Closes all delta writers and renames the delta files from
+        their temporary names, so readers never see a delta file
+        that is still being written
+        """
+        for deltaFile in self.deltaWriters.values():
+            deltaFile.close()
+        self.deltaWriters = {}
+
+        for entry in self.deltaShards.values():
+            tempPath = temporary_path(entry.get('file'))
+            if os.path.isfile(tempPath):
+                os.replace(tempPath, entry.get('file'))
+
     def lock_datafile(self, datafile=''):
         """
         Locking for single datafiles, this is different
@@ -610,13 +1217,25 @@ class Percolator:
             'ppd_timestamp': self.jobDate.isoformat(),
             'type': type,
             'source': source,
-            'comment': comment
+            'comment': comment,
+            'job': self.jobId,
+            'recid': recid
         }
 
-        if self.elastic_logging:
+        if not self.elastic_logging:
+            return
+
+        index = self.get_log_index()
+        if (self.config.get('elastic') or {}).get('index'):
+            # a rolling index contains the logging of many jobs
+            recid = '{job}:{recid}'.format(job=self.jobId, recid=recid)
+
+        if self.changeLogger:
+            self.changeLogger.log(index, recid, rec)
+        else:
             try:
                 self.es.index(
-                    index=self.jobId.lower(),
+                    index=index,
                     id=recid,
                     doc_type='logging',
                     body=json.dumps(rec)
@@ -647,11 +1266,13 @@ class Percolator:
                 )
 
     @db_session
-    def export_records(self, fp=None):
+    def export_records(self, fp=None, idRange=None):
         """
         Exports all the records from a source table (enriched)
 
         :param fp:
+        :param idRange: optional tuple of the first and the last (exclusive) id
+        :return int: number of exported records
         """
         srcEnrich = self.sourceConfig.get('src-enrich', None)
 
@@ -662,18 +1283,106 @@ class Percolator:
                     'FROM {tablename}'.format(
             tablename=tableName
         )
+        params = None
+        if idRange:
+            exportsql += ' WHERE id >= %s AND id < %s'
+            params = idRange
+
+        count = 0
         with self.db.get_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(exportsql)
-                for r in cursor:
-                    jsonRec = json.loads(r[0])
-                    if srcEnrich:
-                        jsonRec = self.enrich_record(jsonRec, srcEnrich)
+            # held over commits of the taxon lookups on this connection
+            with conn.cursor(name='export_records', withhold=True) as cursor:
+                cursor.execute(exportsql, params)
+                for jsonRec in self.read_records(cursor, srcEnrich):
                     if fp:
-                        json.dump(jsonRec, fp)
+                        codec.dump(jsonRec, fp)
                         fp.write('\n')
                     else:
-                        print(json.dumps(jsonRec))
+                        print(codec.dumps(jsonRec))
+                    count += 1
+
+        return count
+
+    @db_session
+    def get_id_ranges(self, shards):
+        """
+        Splits the ids of the current table of the source in ranges
+        of about the same size
+
+        :param shards: number of ranges
+        :return list: tuples of the first and the last (exclusive) id
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT min(id), max(id) FROM {table}_current'.format(
+                    table=self.sourceConfig.get('table')
+                ))
+                low, high = cursor.fetchone()
+
+        if low is None:
+            return []
+
+        size = (high - low) // shards + 1
+        return [
+            (low + number * size, min(low + (number + 1) * size, high + 1))
+            for number in range(shards)
+            if low + number * size <= high
+        ]
+
+    def export_sharded(self, filename, shards=1, workers=1):
+        """
+        Exports all the records of a source in shards. The current
+        table is split in id ranges, every shard is exported (and
+        enriched) by a worker process with its own database connection
+        and enrichment cache. A manifest with the row count of every
+        shard is written next to the shards.
+
+        :param filename: name of the export, the shards are numbered
+        :param shards: number of shard files
+        :param workers: number of worker processes
+        :return dict: manifest
+        """
+        start = timer()
+        base, extension = os.path.splitext(filename)
+        tasks = [
+            (number, '{base}-shard{number}{extension}'.format(base=base, number=number, extension=extension or '.json'),
+             low, high)
+            for number, (low, high) in enumerate(self.get_id_ranges(shards))
+        ]
+
+        logger.info('Exporting "{source}" in {shards} shards with {workers} workers'.format(
+            source=self.source,
+            shards=len(tasks),
+            workers=workers
+        ))
+
+        # database and logging connections can not be shared with forked processes
+        if self.changeLogger:
+            self.changeLogger.flush()
+        self.db.disconnect()
+
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes=workers, initializer=init_worker, initargs=(self, self.source)) as pool:
+            results = pool.map(export_shard, tasks)
+
+        manifest = {
+            'source': self.source,
+            'table': self.sourceConfig.get('table') + '_current',
+            'count': sum(result.get('count') for result in results),
+            'elapsed': timer() - start,
+            'shards': results
+        }
+        with open(base + '-manifest.json', 'w') as fp:
+            json.dump(manifest, fp, indent=2)
+
+        logger.info('[{elapsed:.2f} seconds] Exported {count} records of "{source}" in {shards} shards'.format(
+            elapsed=manifest.get('elapsed'),
+            count=manifest.get('count'),
+            source=self.source,
+            shards=len(results)
+        ))
+
+        return manifest
 
 
     @db_session
@@ -697,6 +1406,7 @@ class Percolator:
         enriches = self.sourceConfig.get('dst-enrich', None)
         start = lap = timer()
         deleteIds = []
+        deleted = 0
 
         try:
             with open(file=filename, mode='r') as f:
@@ -711,7 +1421,7 @@ class Percolator:
         for deleteId in deleteIds:
             if deltaFile:
                 deleteRecord = self.create_delete_record(self.source, deleteId, 'REMOVED')
-                json.dump(deleteRecord, deltaFile)
+                codec.dump(deleteRecord, deltaFile)
                 deltaFile.write('\n')
 
             statusRecord = Deleted_records.get(recid=deleteId)
@@ -730,13 +1440,17 @@ class Percolator:
 
             oldRecord = self.get_record(deleteId)
             if oldRecord:
-                self.delete_record(oldrecord[0])
+                self.delete_record(oldRecord[0])
+                deleted += 1
 
                 if enriches:
+                    jsonRec = codec.loads(oldRecord[1])
+                    self.uncache_taxon_record(jsonRec, code)
+
                     for source in enriches:
                         logger.debug('Enrich source = {source}'.format(source=source))
 
-                        self.handle_impacted(source, oldRecord)
+                        self.handle_impacted(source, jsonRec)
 
                 logger.debug(
                     '[{elapsed:.2f} seconds] Permanently deleted (kill) record "{recordid}" in "{source}"'.format(
@@ -747,8 +1461,10 @@ class Percolator:
                 )
                 lap = timer()
 
+        if deleted:
+            self.bump_generation()
+
         if deltaFile:
-            deltaFile.close()
             meta = {
                 'count': len(deleteIds),
                 'file': deltaFile.name,
@@ -776,9 +1492,11 @@ class Percolator:
         # Use the name of the filename as a job id
         if not self.jobId:
             filename = datafile.split('/')[-1]
-            self.jobId = filename.replace('.json', '')
+            self.jobId = strip_extension(filename)
 
         self.db.execute("TRUNCATE public.{table}".format(table=table))
+        if table.endswith('_import'):
+            self.set_unlogged(table=table)
 
         # empties the table
         self.db.execute('ALTER TABLE public.{table} DROP CONSTRAINT IF EXISTS hindex'.format(table=table))
@@ -787,21 +1505,29 @@ class Percolator:
         self.db.execute('DROP INDEX IF EXISTS public.idx_{table}__jsonid'.format(table=table))
         self.db.execute('DROP INDEX IF EXISTS public.idx_{table}__hash'.format(table=table))
         self.db.execute('DROP INDEX IF EXISTS public.idx_{table}__gin'.format(table=table))
+        self.db.execute('DROP INDEX IF EXISTS public.idx_{table}__sciname'.format(table=table))
+        self.db.execute('DROP INDEX IF EXISTS public.idx_{table}__scinamegroup'.format(table=table))
 
         # removes the hash column
         self.db.execute("ALTER TABLE public.{table} ALTER COLUMN hash DROP NOT NULL".format(table=table))
+
+        # the hash is set while loading
+        self.set_hash_trigger(table=table)
         logger.debug('[{elapsed:.2f} seconds] Reset "{table}" for import'.format(table=table, elapsed=(timer() - lap)))
         lap = timer()
 
         # imports all data by reading the jsonlines as a one column csv
         try:
-            self.db.execute(
-                "COPY public.{table} (rec) FROM '{datafile}' "
-                "CSV QUOTE e'\x01' DELIMITER e'\x02'".format(
-                    table=table,
-                    datafile=datafile
+            if self.is_enabled('stream-import') or is_compressed(datafile):
+                self.stream_data(table=table, datafile=datafile)
+            else:
+                self.db.execute(
+                    "COPY public.{table} (rec) FROM '{datafile}' "
+                    "CSV QUOTE e'\x01' DELIMITER e'\x02'".format(
+                        table=table,
+                        datafile=datafile
+                    )
                 )
-            )
         except Exception as err:
             msg = 'Import of "{datafile}" into "{table}" failed:\n\n{error}'.format(table=table,
                                                                                     datafile=datafile,
@@ -819,22 +1545,83 @@ class Percolator:
         )
         lap = timer()
 
-        # zet de hash
-        logger.debug(
-            '[{elapsed:.2f} seconds] Start set hashing on "{table}"'.format(table=table, elapsed=(timer() - lap)))
-        self.db.execute("UPDATE {table} SET hash=md5(rec::text)".format(table=table))
-        logger.debug(
-            '[{elapsed:.2f} seconds] End set hashing on "{table}"'.format(table=table, elapsed=(timer() - lap)))
-        lap = timer()
-
         self.set_indexes(table=table)
 
-    @db_session
-    def set_indexes(self, table=''):
+    def get_hash_excludes(self):
         """
-        Sets the indexes of a table
+        Returns the paths in the record which are ignored by the
+        hash, as postgres text array literals. The paths are listed
+        in 'hash-exclude' of the source config, in dotted notation
+        (for example 'sourceSystem.processingDate').
 
-        :param table:
+        :return list:
+        """
+        excludes = []
+        for path in self.sourceConfig.get('hash-exclude') or []:
+            elements = []
+            for element in str(path).split('.'):
+                elements.append('"' + element.replace('\\', '\\\\').replace('"', '\\"') + '"')
+            excludes.append('{' + ','.join(elements) + '}')
+
+        return excludes
+
+    def set_hash_trigger(self, table=''):
+        """
+        Creates a trigger which sets the hash of each inserted record,
+        so the hash is computed while loading the data instead of
+        rewriting the whole table afterwards. Records that already
+        have a hash (copied from the import table) are left alone.
+        The trigger function is created by upgrade_database.
+
+        The paths in 'hash-exclude' are passed to the trigger, these
+        are removed from the record before hashing. Changes in those
+        (volatile) fields do not lead to updates.
+
+        :param table:
+        """
+        arguments = ', '.join(
+            "'" + exclude.replace("'", "''") + "'" for exclude in self.get_hash_excludes()
+        )
+
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("DROP TRIGGER IF EXISTS percolator_hash ON public.{table}".format(table=table))
+                cursor.execute(
+                    "CREATE TRIGGER percolator_hash BEFORE INSERT ON public.{table} "
+                    "FOR EACH ROW EXECUTE PROCEDURE percolator_hash({arguments})".format(
+                        table=table,
+                        arguments=arguments
+                    )
+                )
+
+    def stream_data(self, table='', datafile=''):
+        """
+        Streams a (compressed) jsonlines file from this process to
+        the database, the database server does not need access to
+        the file.
+
+        :param table:
+        :param datafile:
+        """
+        chunkSize = int(self.get_setting('stream-chunk-size', 1048576))
+
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                with DataFile(datafile) as fp:
+                    cursor.copy_expert(
+                        "COPY public.{table} (rec) FROM STDIN "
+                        "CSV QUOTE e'\x01' DELIMITER e'\x02'".format(table=table),
+                        fp,
+                        size=chunkSize
+                    )
+                    fp.log_progress()
+
+    @db_session
+    def set_indexes(self, table=''):
+        """
+        Sets the indexes of a table
+
+        :param table:
         """
         lap = timer()
         enrichmentSource = self.sourceConfig.get('src-enrich', False)
@@ -897,17 +1684,18 @@ class Percolator:
                     elapsed=(timer() - lap))
             )
 
-        # set an index on the part containing scientificNameGroup,
-        # which should be present in taxa sources
+        # set an index on scientificNameGroup, which should be present
+        # in taxa sources, taxa are looked up by equality on it
         if enrichmentDestination:
             logger.debug(
                 '[{elapsed:.2f} seconds] Start set index on scientificNameGroup in "{table}"'.format(
                     table=table,
                     elapsed=(timer() - lap))
             )
+            self.db.execute('DROP INDEX IF EXISTS public.idx_{table}__sciname'.format(table=table))
             self.db.execute(
-                "CREATE INDEX IF NOT EXISTS idx_{table}__sciname "
-                "ON public.{table} USING gin((rec->'acceptedName') jsonb_path_ops)".format(
+                "CREATE INDEX IF NOT EXISTS idx_{table}__scinamegroup "
+                "ON public.{table} USING BTREE((rec->'acceptedName'->>'scientificNameGroup'))".format(
                     table=table
                 )
             )
@@ -936,20 +1724,21 @@ class Percolator:
             table=tableName,
             id=id
         ))
-        jsonsql = '(rec->>\'{idfield}\' = \'{idvalue}\')'.format(
-            idfield=idField,
-            idvalue=id
+        statement = 'record_by_id_' + tableName.lower()
+        self.statements.register(
+            statement,
+            ['text'],
+            "SELECT * "
+            "FROM {table} "
+            "WHERE rec->>'{idfield}' = $1".format(
+                table=tableName,
+                idfield=idField
+            )
         )
         result = False
-        query = "SELECT * " \
-                "FROM {table} " \
-                "WHERE {where}".format(
-            table=tableName,
-            where=jsonsql
-        )
         with self.db.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query)
+                self.statements.execute(cursor, statement, id)
                 result = cursor.fetchone()
 
         return result
@@ -969,14 +1758,18 @@ class Percolator:
 
         tableName = base.capitalize() + '_' + suffix
 
-        query = "DELETE FROM {table} " \
-                "WHERE id={id}".format(
-            table=tableName,
-            id=id
+        statement = 'delete_by_id_' + tableName.lower()
+        self.statements.register(
+            statement,
+            ['integer'],
+            "DELETE FROM {table} "
+            "WHERE id = $1".format(
+                table=tableName
+            )
         )
         with self.db.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query)
+                self.statements.execute(cursor, statement, id)
 
         return
 
@@ -985,6 +1778,8 @@ class Percolator:
         """
         Removes double records. Some sources can contain double
         records, these should be removed, before checking the hash.
+        Of every record id only the last loaded record is kept, all
+        surplus records are removed in a single statement.
         """
         start = lap = timer()
 
@@ -992,52 +1787,53 @@ class Percolator:
             '[{elapsed:.2f} seconds] Start filtere records with more than one entry in the source data'.format(
                 elapsed=(timer() - lap))
         )
-        doubleQuery = "SELECT array_agg(id) importids, rec->>'{idfield}' recid " \
-                      "FROM {source}_{suffix} " \
-                      "GROUP BY rec->>'{idfield}' HAVING COUNT(*) > 1".format(
+        doubleQuery = "WITH removed AS (" \
+                      "DELETE FROM {source}_{suffix} WHERE id IN (" \
+                      "SELECT id FROM (" \
+                      "SELECT id, ROW_NUMBER() OVER (PARTITION BY rec->>'{idfield}' ORDER BY id DESC) AS rownumber " \
+                      "FROM {source}_{suffix}" \
+                      ") numbered WHERE rownumber > 1" \
+                      ") RETURNING rec->>'{idfield}' AS recid" \
+                      ") SELECT COUNT(DISTINCT recid), COUNT(*) FROM removed".format(
             suffix=suffix,
             source=self.sourceConfig.get('table'),
             idfield=self.sourceConfig.get('id'))
 
-        doubles = self.db.select(doubleQuery)
-        logger.debug('[{elapsed:.2f} seconds] Find doubles'.format(elapsed=(timer() - lap)))
-
-        lap = timer()
-
-        count = 0
-        for double in doubles:
-            for importid in double.importids[:-1]:
-                deletequery = "DELETE FROM {source}_{suffix} WHERE id = {importid}".format(
-                    suffix=suffix,
-                    source=self.sourceConfig.get('table'),
-                    importid=importid)
-                self.db.execute(deletequery)
-            count += 1
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(doubleQuery)
+                count, removed = cursor.fetchone()
 
         logger.debug(
-            '[{elapsed:.2f} seconds] End filtered {doubles} records with more than one entry in the source data'.format(
+            '[{elapsed:.2f} seconds] End filtered {doubles} records with more than one entry in the source data, '
+            '{removed} removed'.format(
                 doubles=count,
+                removed=removed,
                 elapsed=(timer() - lap))
         )
 
         doubles = {
             'count': count,
+            'removed': removed,
             'elapsed': (timer() - start)
         }
         self.set_metainfo(key='doubles', value=doubles)
 
+        return doubles
+
     @db_session
     def list_changes(self):
         """
         Identifies differences between the current database and the
-        imported data. It does this by comparing hashes.
+        imported data. It does this by joining both tables on the
+        record id and comparing the hashes, in a single query.
 
-        If a hash is missing in the current database, but if it is
-        present in the imported, than it could be a new record, or
-        an update.
+        An imported record without a counterpart in the current
+        database is a new record, a record present in both with a
+        different hash is an update.
 
-        A hash that is present in the current data, but is missing
-        in the imported data can be deleted record. But this
+        A record that is present in the current data, but is missing
+        in the imported data is a deleted record. But this
         comparison can only be done with complete datasets. The
         changes dictionary looks something like this.
 
@@ -1070,131 +1866,73 @@ class Percolator:
         }
         source_base = self.sourceConfig.get('table')
         idField = self.sourceConfig.get('id')
-        updateOrDeletes = None
 
         lap = timer()
         if len(source_base):
-            logger.debug(
-                '[{elapsed:.2f} seconds] Start left full outer join on "{source}"'.format(
-                    source=source_base,
-                    elapsed=(timer() - lap)
+            # Both sides are matched on the record id (which is indexed
+            # by set_indexes), only pairs with differing hashes are
+            # returned. Incremental sources only have explicit deletes,
+            # so a left join on the import table is sufficient.
+            joinType = 'LEFT OUTER JOIN' if self.is_incremental() else 'FULL OUTER JOIN'
+            diffquery = 'SELECT {source}_import.id, {source}_current.id, ' \
+                        'COALESCE({source}_import.rec->>\'{idfield}\', {source}_current.rec->>\'{idfield}\') ' \
+                        'FROM {source}_import ' \
+                        '{jointype} {source}_current ' \
+                        'ON {source}_import.rec->>\'{idfield}\' = {source}_current.rec->>\'{idfield}\' ' \
+                        'WHERE {source}_import.hash IS DISTINCT FROM {source}_current.hash' \
+                        '{partition}'.format(
+                source=source_base,
+                idfield=idField,
+                jointype=joinType,
+                partition=self.partition_filter(
+                    'COALESCE({source}_import.rec->>\'{idfield}\', {source}_current.rec->>\'{idfield}\')'.format(
+                        source=source_base,
+                        idfield=idField
+                    )
                 )
             )
-            leftdiffquery = 'SELECT {source}_import.id, {source}_import.hash ' \
-                            'FROM {source}_import ' \
-                            'FULL OUTER JOIN {source}_current ' \
-                            'ON {source}_import.hash = {source}_current.hash ' \
-                            'WHERE {source}_current.hash is null'.format(source=source_base)
-
-            # @todo: maybe rewrite this to native postgres
-            neworupdates = self.db.select(leftdiffquery)
+
             logger.debug(
-                '[{elapsed:.2f} seconds] End left full outer join on "{source}": {count}'.format(
+                '[{elapsed:.2f} seconds] Start {jointype} on "{source}"'.format(
+                    jointype=joinType.lower(),
                     source=source_base,
-                    elapsed=(timer() - lap),
-                    count=len(neworupdates)
+                    elapsed=(timer() - lap)
                 )
             )
-            lap = timer()
 
-            if not self.is_incremental():
-                # this part is only done when a source is non incremental
-                logger.debug(
-                    '[{elapsed:.2f} seconds] Start right full outer join on "{source}"'.format(
-                        source=source_base,
-                        elapsed=(timer() - lap)
-                    )
-                )
-                rightdiffquery = 'SELECT {source}_current.id, {source}_current.hash ' \
-                                 'FROM {source}_import ' \
-                                 'FULL OUTER JOIN {source}_current ' \
-                                 'ON {source}_import.hash = {source}_current.hash ' \
-                                 'WHERE {source}_import.hash is null'.format(source=source_base)
-
-                # @todo: maybe rewrite this to native postgres
-                updateOrDeletes = self.db.select(rightdiffquery)
-                logger.debug(
-                    '[{elapsed:.2f} seconds] End right full outer join on "{source}": {count}'.format(
-                        source=source_base,
-                        elapsed=(timer() - lap),
-                        count=len(updateOrDeletes)
-                    )
-                )
-            lap = timer()
-
-            #importtable = globals()[source_base.capitalize() + '_import']
-            #currenttable = globals()[source_base.capitalize() + '_current']
-
-            # new or update
             count = 0
             with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    for result in neworupdates:
-                        if result[1]:
-                            count += 1
-                            if count % 1000 == 0:
-                                logger.debug('{count} neworupdates: '
-                                             '{new} new, {update} updates, {delete} deletes'.format(
-                                    count=count,
-                                    update=len(self.changes['update']),
-                                    delete=len(self.changes['delete']),
-                                    new=len(self.changes['new'])
-                                ))
-                            importsql = 'SELECT id, rec ' \
-                                        'FROM {source}_import ' \
-                                        'WHERE {source}_import.hash=%s'.format(
-                                source=source_base
-                            )
-                            cursor.execute(importsql, (result[1],))
-                            r = cursor.fetchone()
-                            if r:
-                                rec = json.loads(r[1])
-                                uuid = rec[idField]
-                                oldrec = self.get_record(uuid)
-                                if self.is_incremental() and oldrec:
-                                    self.changes['update'][uuid] = [r[0]]
-                                    self.changes['update'][uuid].append(oldrec[0])
-                                    logger.debug('Update {oldid} to {newid}'.format(
-                                        oldid=oldrec[0],
-                                        newid=r[0]
-                                    ))
-                                else:
-                                    self.changes['new'][uuid] = [r[0]]
+                # server side cursor, the differences are streamed
+                with conn.cursor(name='list_changes') as cursor:
+                    cursor.itersize = 10000
+                    cursor.execute(diffquery)
+                    for importId, currentId, uuid in cursor:
+                        count += 1
+                        if count % 100000 == 0:
+                            logger.debug('{count} differences: '
+                                         '{new} new, {update} updates, {delete} deletes'.format(
+                                count=count,
+                                update=len(self.changes['update']),
+                                delete=len(self.changes['delete']),
+                                new=len(self.changes['new'])
+                            ))
+                        if uuid is None:
+                            logger.error('Empty id in differences')
+                        elif importId and currentId:
+                            self.changes['update'][uuid] = [importId, currentId]
+                        elif importId:
+                            self.changes['new'][uuid] = [importId]
                         else:
-                            logger.error('Empty hash in neworupdates')
+                            self.changes['delete'][uuid] = [currentId]
 
-            with self.db.get_connection() as conn:
-                with conn.cursor() as cursor:
-                    if not self.is_incremental():
-                        # incremental sources only have explicit deletes
-                        count = 0
-                        for result in updateOrDeletes:
-                            count += 1
-                            if count % 1000 == 0:
-                                logger.debug('{count} updatedordeletes: '
-                                             '{new} new, {update} updates, {delete} deletes'.format(
-                                    count=count,
-                                    update=len(self.changes['update']),
-                                    delete=len(self.changes['delete']),
-                                    new=len(self.changes['new'])
-                                ))
-                            if result[1]:
-                                currentsql = 'SELECT id, rec ' \
-                                             'FROM {source}_current ' \
-                                             'WHERE {source}_current.hash=%s'.format(source=source_base)
-                                cursor.execute(currentsql, (result[1],))
-                                r = cursor.fetchone()
-                                if r:
-                                    rec = json.loads(r[1])
-                                    uuid = rec[idField]
-                                    if self.changes['new'].get(uuid, False):
-                                        self.changes['update'][uuid] = self.changes['new'].get(uuid)
-                                        self.changes['update'][uuid].append(r[0])
-                                        del self.changes['new'][uuid]
-                                    else:
-                                        self.changes['delete'][uuid] = [r[0]]
-                            else:
-                                logger.error('Empty hash in updateordeletes')
+            logger.debug(
+                '[{elapsed:.2f} seconds] End {jointype} on "{source}": {count}'.format(
+                    jointype=joinType.lower(),
+                    source=source_base,
+                    elapsed=(timer() - lap),
+                    count=count
+                )
+            )
 
             if len(self.changes['new']) or len(self.changes['update']) or len(self.changes['delete']):
                 if len(self.changes['new']):
@@ -1245,20 +1983,9 @@ class Percolator:
 
         with self.db.get_connection() as conn:
             with conn.cursor() as cursor:
-                for jsonId, databaseIds in self.changes['new'].items():
+                for databaseIds, jsonRec in self.read_changes(cursor, self.changes['new'].values(), srcEnrich):
                     importId = databaseIds[0]
 
-                    importsql = 'SELECT rec ' \
-                                'FROM {source}_import ' \
-                                'WHERE {source}_import.id=%s'.format(
-                        source=table.capitalize()
-                    )
-                    cursor.execute(importsql, (importId,))
-                    r = cursor.fetchone()
-                    jsonRec = json.loads(r[0])
-                    if srcEnrich:
-                        jsonRec = self.enrich_record(jsonRec, srcEnrich)
-
                     insertQuery = "INSERT INTO {table}_current (rec, hash, datum) " \
                                   "SELECT rec, hash, datum FROM {table}_import where id={id}".format(
                         table=self.sourceConfig.get('table'),
@@ -1267,7 +1994,7 @@ class Percolator:
 
                     self.db.execute(insertQuery)
                     if deltaFile:
-                        json.dump(jsonRec, deltaFile)
+                        codec.dump(jsonRec, deltaFile)
                         deltaFile.write('\n')
 
                     code = self.sourceConfig.get('code')
@@ -1289,10 +2016,181 @@ class Percolator:
                     )
                     lap = timer()
 
-        self.set_indexes(table + '_current')
+        if self.partition is None:
+            # partitioned workers leave the indexes to the main process
+            self.set_indexes(table + '_current')
+
+        if deltaFile:
+            meta = {
+                'count': len(self.changes['new']),
+                'file': deltaFile.name,
+                'elapsed': timer() - start
+            }
+            self.set_metainfo(key='new', value=meta)
+
+    def load_id_table(self, cursor, name, **columns):
+        """
+        Creates a temporary table with (pairs of) database ids, which
+        can be joined in set based statements. Every keyword argument
+        is an integer column with a list of values.
+
+        :param cursor:
+        :param name:
+        :param columns:
+        """
+        batchSize = int(self.get_setting('batch-size', 10000))
+        names = list(columns.keys())
+        values = list(columns.values())
+
+        cursor.execute('DROP TABLE IF EXISTS {name}'.format(name=name))
+        cursor.execute('CREATE TEMPORARY TABLE {name} ({columns})'.format(
+            name=name,
+            columns=', '.join(column + ' integer' for column in names)
+        ))
+
+        insertQuery = 'INSERT INTO {name} ({columns}) ' \
+                      'SELECT * FROM unnest({arrays})'.format(
+            name=name,
+            columns=', '.join(names),
+            arrays=', '.join(['%s::integer[]'] * len(names))
+        )
+        for offset in range(0, len(values[0]), batchSize):
+            cursor.execute(insertQuery, tuple(value[offset:offset + batchSize] for value in values))
+
+        cursor.execute('ANALYZE {name}'.format(name=name))
+
+    def is_passthrough(self):
+        """
+        Checks if records of the source can be written to the delta
+        files as they are stored, that is when passthrough is enabled
+        and the source is neither enriched nor enriches other sources
+
+        :return bool:
+        """
+        return self.is_enabled('passthrough') and \
+            not self.sourceConfig.get('src-enrich') and \
+            not self.sourceConfig.get('dst-enrich')
+
+    def passthrough_records(self, conn, query, deltaFile, state):
+        """
+        Streams the json text of the records selected by a query
+        straight from postgres to the delta file, nothing is parsed.
+        The query selects the record id (for logging) and the record.
+
+        :param conn:
+        :param query:
+        :param deltaFile:
+        :param state: state of the logged changes
+        """
+        lap = timer()
+
+        passthrough = Passthrough(deltaFile)
+        with conn.cursor() as cursor:
+            cursor.copy_expert(copy_query(query), passthrough)
+
+        for recid in passthrough.ids:
+            self.log_change(
+                state=state,
+                recid=recid,
+                source=self.sourceConfig.get('code'),
+                type=self.sourceConfig.get('index', 'noindex')
+            )
+
+        logger.debug(
+            '[{elapsed:.2f} seconds] Passed {count} {state} records through to "{file}"'.format(
+                elapsed=(timer() - lap),
+                count=len(passthrough.ids),
+                state=state,
+                file=deltaFile.name
+            )
+        )
+
+    @db_session
+    def handle_new_bulk(self):
+        """
+        Handles new records in bulk. The new records are copied from
+        the import to the current table in batches of import ids,
+        afterwards all new records are written to the delta file in
+        a single ordered pass.
+        """
+        table = self.sourceConfig.get('table')
+        idField = self.sourceConfig.get('id')
+        index = self.sourceConfig.get('index', 'noindex')
+        srcEnrich = self.sourceConfig.get('src-enrich', False)
+        dstEnrich = self.sourceConfig.get('dst-enrich', None)
+        code = self.sourceConfig.get('code')
+        batchSize = int(self.get_setting('batch-size', 10000))
+
+        importIds = sorted(databaseIds[0] for databaseIds in self.changes['new'].values())
+
+        deltaFile = self.open_deltafile('new', index)
+
+        start = lap = timer()
+
+        insertQuery = 'INSERT INTO {table}_current (rec, hash, datum) ' \
+                      'SELECT {table}_import.rec, {table}_import.hash, {table}_import.datum ' \
+                      'FROM new_ids ' \
+                      'JOIN {table}_import ON {table}_import.id = new_ids.importid ' \
+                      'WHERE new_ids.importid BETWEEN %s AND %s ' \
+                      'ORDER BY {table}_import.id'.format(table=table)
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                self.load_id_table(cursor, 'new_ids', importid=importIds)
+                for offset in range(0, len(importIds), batchSize):
+                    batch = importIds[offset:offset + batchSize]
+                    cursor.execute(insertQuery, (batch[0], batch[-1]))
+                    logger.debug(
+                        '[{elapsed:.2f} seconds] Inserted {count} new records in "{source}"'.format(
+                            elapsed=(timer() - lap),
+                            source=table + '_current',
+                            count=cursor.rowcount
+                        )
+                    )
+                    lap = timer()
+
+            fromsql = 'FROM {table}_import ' \
+                      'JOIN new_ids ON new_ids.importid = {table}_import.id ' \
+                      'ORDER BY {table}_import.id'.format(table=table)
+            importsql = 'SELECT {table}_import.rec '.format(table=table) + fromsql
+            if deltaFile and self.is_passthrough():
+                passthroughsql = "SELECT {table}_import.rec->>'{idfield}', {table}_import.rec ".format(
+                    table=table,
+                    idfield=idField
+                ) + fromsql
+                self.passthrough_records(conn, passthroughsql, deltaFile, state='new')
+            else:
+                # held over commits of the taxon lookups on this connection
+                with conn.cursor(name='handle_new', withhold=True) as cursor:
+                    cursor.itersize = batchSize
+                    cursor.execute(importsql)
+                    for jsonRec in self.read_records(cursor, srcEnrich):
+                        if deltaFile:
+                            codec.dump(jsonRec, deltaFile)
+                            deltaFile.write('\n')
+
+                        if dstEnrich:
+                            self.cache_taxon_record(jsonRec, code)
+
+                        self.log_change(
+                            state='new',
+                            recid=jsonRec.get(idField, 'no id'),
+                            source=code,
+                            type=index
+                        )
+
+        logger.debug(
+            '[{elapsed:.2f} seconds] Written {count} new records of "{source}"'.format(
+                elapsed=(timer() - lap),
+                source=table + '_current',
+                count=len(importIds)
+            )
+        )
+
+        if self.partition is None:
+            # partitioned workers leave the indexes to the main process
+            self.set_indexes(table + '_current')
 
         if deltaFile:
-            deltaFile.close()
             meta = {
                 'count': len(self.changes['new']),
                 'file': deltaFile.name,
@@ -1325,16 +2223,8 @@ class Percolator:
         start = lap = timer()
         with self.db.get_connection() as conn:
             with conn.cursor() as cursor:
-                for change, recordIds in self.changes['update'].items():
-                    # first id points to the new rec
-                    importsql = 'SELECT {source}_import.rec ' \
-                                'FROM {source}_import ' \
-                                'WHERE {source}_import.id=%s'.format(
-                        source=tableBase.capitalize()
-                    )
-                    cursor.execute(importsql, (recordIds[0],))
-                    importRec = cursor.fetchone()
-
+                # first id points to the new rec
+                for recordIds, jsonRec in self.read_changes(cursor, self.changes['update'].values(), enrichSources):
                     currentsql = 'SELECT {source}_current.rec ' \
                                  'FROM {source}_current ' \
                                  'WHERE {source}_current.id=%s'.format(
@@ -1343,12 +2233,6 @@ class Percolator:
                     cursor.execute(currentsql, (recordIds[1],))
                     oldRec = cursor.fetchone()
                     if (oldRec):
-                        jsonRec = json.loads(importRec[0])
-
-                        # If this record should be enriched by specified sources
-                        if enrichSources:
-                            jsonRec = self.enrich_record(jsonRec, enrichSources)
-
                         # @todo: when it is an update, the record should be checked in the deleted list
                         updateQuery = "UPDATE {table}_current SET (rec, hash, datum) = " \
                                       "(SELECT rec, hash, datum FROM {table}_import " \
@@ -1359,7 +2243,7 @@ class Percolator:
                             importid=recordIds[0])
 
                         if deltaFile:
-                            json.dump(jsonRec, deltaFile)
+                            codec.dump(jsonRec, deltaFile)
                             deltaFile.write('\n')
 
                         self.db.execute(updateQuery)
@@ -1392,7 +2276,106 @@ class Percolator:
                         lap = timer()
 
         if deltaFile:
-            deltaFile.close()
+            meta = {
+                'count': len(self.changes['update']),
+                'file': deltaFile.name,
+                'elapsed': timer() - start
+            }
+            self.set_metainfo(key='update', value=meta)
+
+    @db_session
+    def handle_updates_bulk(self):
+        """
+        Handles updates in bulk. The pairs of import and current ids
+        are loaded in a temporary table, each batch of pairs is then
+        applied with a single update statement. Afterwards the
+        updated records are written to the delta file in a single
+        ordered pass.
+
+        Impacted records of taxon updates are handled after all
+        updates are stored.
+        """
+        tableBase = self.sourceConfig.get('table')
+        idField = self.sourceConfig.get('id')
+        enrichDestinations = self.sourceConfig.get('dst-enrich', None)
+        enrichSources = self.sourceConfig.get('src-enrich', None)
+        index = self.sourceConfig.get('index', 'noindex')
+        code = self.sourceConfig.get('code', '')
+        batchSize = int(self.get_setting('batch-size', 10000))
+
+        pairs = sorted(recordIds[:2] for recordIds in self.changes['update'].values())
+        importIds = [pair[0] for pair in pairs]
+        currentIds = [pair[1] for pair in pairs]
+
+        deltaFile = self.open_deltafile('update', index)
+
+        start = lap = timer()
+
+        updateQuery = 'UPDATE {table}_current ' \
+                      'SET rec = {table}_import.rec, hash = {table}_import.hash, datum = {table}_import.datum ' \
+                      'FROM update_ids ' \
+                      'JOIN {table}_import ON {table}_import.id = update_ids.importid ' \
+                      'WHERE {table}_current.id = update_ids.currentid ' \
+                      'AND update_ids.importid BETWEEN %s AND %s'.format(table=tableBase)
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                self.load_id_table(cursor, 'update_ids', importid=importIds, currentid=currentIds)
+                for offset in range(0, len(importIds), batchSize):
+                    batch = importIds[offset:offset + batchSize]
+                    cursor.execute(updateQuery, (batch[0], batch[-1]))
+                    logger.debug(
+                        '[{elapsed:.2f} seconds] Updated {count} records in "{source}"'.format(
+                            elapsed=(timer() - lap),
+                            source=tableBase + '_current',
+                            count=cursor.rowcount
+                        )
+                    )
+                    lap = timer()
+
+            fromsql = 'FROM {table}_import ' \
+                      'JOIN update_ids ON update_ids.importid = {table}_import.id ' \
+                      'ORDER BY {table}_import.id'.format(table=tableBase)
+            importsql = 'SELECT {table}_import.rec '.format(table=tableBase) + fromsql
+            if deltaFile and self.is_passthrough():
+                passthroughsql = "SELECT {table}_import.rec->>'{idfield}', {table}_import.rec ".format(
+                    table=tableBase,
+                    idfield=idField
+                ) + fromsql
+                self.passthrough_records(conn, passthroughsql, deltaFile, state='update')
+            else:
+                # held over commits of the taxon lookups on this connection
+                with conn.cursor(name='handle_updates', withhold=True) as cursor:
+                    cursor.itersize = batchSize
+                    cursor.execute(importsql)
+                    # If these records should be enriched by specified sources
+                    for jsonRec in self.read_records(cursor, enrichSources):
+                        if deltaFile:
+                            codec.dump(jsonRec, deltaFile)
+                            deltaFile.write('\n')
+
+                        # If this record has impact on records that should
+                        # be enriched again (at the end of the job)
+                        if enrichDestinations:
+                            self.cache_taxon_record(jsonRec, code)
+                            for source in enrichDestinations:
+                                self.handle_impacted(source, jsonRec)
+
+                        self.log_change(
+                            state='update',
+                            recid=jsonRec.get(idField, ''),
+                            source=code,
+                            type=index
+                        )
+
+        logger.debug(
+            '[{elapsed:.2f} seconds] Written {count} updated records of "{source}"'.format(
+                elapsed=(timer() - lap),
+                source=tableBase + '_current',
+                count=len(importIds)
+            )
+        )
+
+        if deltaFile:
             meta = {
                 'count': len(self.changes['update']),
                 'file': deltaFile.name,
@@ -1426,11 +2409,11 @@ class Percolator:
                     cursor.execute(currentsql, (recordIds[0],))
                     oldRecord = cursor.fetchone()
                     if oldRecord:
-                        jsonRec = json.loads(oldRecord[0])
+                        jsonRec = codec.loads(oldRecord[0])
                         deleteId = jsonRec.get(idField)
                         if deltaFile and deleteId:
                             deleteRecord = self.create_delete_record(self.source, deleteId, 'REJECTED')
-                            json.dump(deleteRecord, deltaFile)
+                            codec.dump(deleteRecord, deltaFile)
                             deltaFile.write('\n')
 
                         statusRecord = Deleted_records.get(recid=deleteId)
@@ -1454,7 +2437,7 @@ class Percolator:
 
                         if enriches:
                             code = self.sourceConfig.get('code')
-                            self.cache_taxon_record(jsonRec, code)
+                            self.uncache_taxon_record(jsonRec, code)
 
                             for source in enriches:
                                 logger.debug('Enrich source = {source}'.format(source=source))
@@ -1472,7 +2455,6 @@ class Percolator:
                         logger.info("Record [{deleteid}] deleted".format(deleteid=deleteId))
 
         if deltaFile:
-            deltaFile.close()
             meta = {
                 'count': len(self.changes['delete']),
                 'file': deltaFile.name,
@@ -1480,47 +2462,90 @@ class Percolator:
             }
             self.set_metainfo(key='delete', value=meta)
 
-    def list_impacted(self, sourceConfig, scientificNameGroup):
+    @db_session
+    def handle_deletes_bulk(self):
         """
-        Looks for impacted records based on scientificnamegroup
-
-        :param scientificNameGroup:
-        :return bool or list of items:
+        Handles temporary deleted records in bulk. The current ids
+        are loaded in a temporary table, each batch is deleted with a
+        single statement returning the removed records for the delta
+        file. The deleted records administration is updated with a
+        single upsert per batch.
         """
-        table = sourceConfig.get('table')
-        currenttable = globals()[table.capitalize() + '_current']
+        table = self.sourceConfig.get('table')
+        idField = self.sourceConfig.get('id')
+        enriches = self.sourceConfig.get('enriches', None)
+        index = self.sourceConfig.get('index', 'noindex')
+        code = self.sourceConfig.get('code', '')
+        batchSize = int(self.get_setting('batch-size', 10000))
 
-        jsonsql = 'rec->\'identifications\' @> \'[{"scientificName":{"scientificNameGroup":"%s"}}]\'' % (
-            scientificNameGroup
-        )
-        items = []
-        query = "SELECT * " \
-                "FROM {table} " \
-                "WHERE {where}".format(
-            table=table.capitalize() + '_current',
-            where=jsonsql
-        )
+        currentIds = sorted(recordIds[0] for recordIds in self.changes['delete'].values())
+
+        # Write data to deltafile file
+        deltaFile = self.open_deltafile('delete', index)
+
+        start = lap = timer()
+
+        deleteQuery = 'DELETE FROM {table}_current ' \
+                      'USING delete_ids ' \
+                      'WHERE {table}_current.id = delete_ids.currentid ' \
+                      'AND delete_ids.currentid BETWEEN %s AND %s ' \
+                      'RETURNING {table}_current.rec'.format(table=table)
+        statusQuery = 'INSERT INTO deleted_records (recid, status, count) ' \
+                      'SELECT DISTINCT recid, \'REJECTED\', 1 FROM unnest(%s::text[]) AS recid ' \
+                      'ON CONFLICT (recid) DO UPDATE SET count = deleted_records.count + 1'
         with self.db.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query)
-                items = cursor.fetchall()
+                self.load_id_table(cursor, 'delete_ids', currentid=currentIds)
 
-        if len(items):
-            logger.info(
-                "Found {number} records in {source} with scientificNameGroup={namegroup}".format(
-                    number=len(items),
-                    source=table.capitalize(),
-                    namegroup=scientificNameGroup)
-            )
-            return items
-        else:
-            logger.error(
-                "Found no records in {source} with scientificNameGroup={namegroup}".format(
-                    number=len(items),
-                    source=table.capitalize(),
-                    namegroup=scientificNameGroup)
-            )
-            return items
+                for offset in range(0, len(currentIds), batchSize):
+                    batch = currentIds[offset:offset + batchSize]
+                    cursor.execute(deleteQuery, (batch[0], batch[-1]))
+
+                    deleteIds = []
+                    for oldRecord in cursor.fetchall():
+                        jsonRec = codec.loads(oldRecord[0])
+                        deleteId = jsonRec.get(idField)
+                        if not deleteId:
+                            continue
+                        deleteIds.append(deleteId)
+
+                        if deltaFile:
+                            deleteRecord = self.create_delete_record(self.source, deleteId, 'REJECTED')
+                            codec.dump(deleteRecord, deltaFile)
+                            deltaFile.write('\n')
+
+                        self.log_change(
+                            state='delete',
+                            recid=deleteId,
+                            type=index,
+                            source=code
+                        )
+
+                        if enriches:
+                            self.uncache_taxon_record(jsonRec, code)
+                            for source in enriches:
+                                self.handle_impacted(source, jsonRec)
+
+                    cursor.execute(statusQuery, (deleteIds,))
+
+                    logger.debug(
+                        '[{elapsed:.2f} seconds] Temporarily deleted {count} records in "{source}"'.format(
+                            source=table + '_current',
+                            elapsed=(timer() - lap),
+                            count=len(deleteIds)
+                        )
+                    )
+                    lap = timer()
+
+        logger.info("{count} records deleted".format(count=len(currentIds)))
+
+        if deltaFile:
+            meta = {
+                'count': len(self.changes['delete']),
+                'file': deltaFile.name,
+                'elapsed': timer() - start
+            }
+            self.set_metainfo(key='delete', value=meta)
 
     def get_taxon(self, scientificNameGroup, source):
         """
@@ -1542,7 +2567,7 @@ class Percolator:
         code = sourceConfig.get('code')
 
         # Retrieve the taxon from cache
-        taxonKey = '_'.join([code, scientificNameGroup])
+        taxonKey = cache.key(code, scientificNameGroup)
         taxons = cache.get(taxonKey)
 
         if taxons is not None:
@@ -1556,21 +2581,21 @@ class Percolator:
             return False
 
         # Retrieve the taxon from the database
-        sciSql = 'rec->\'acceptedName\' @> \'{"scientificNameGroup":"%s"}\'' % (
-            scientificNameGroup
-        )
-        #taxonQuery = currentTable.select(lambda p: raw_sql(sciSql))
-        query = "SELECT rec " \
-                "FROM {table} " \
-                "WHERE {where}".format(
-            table=table.capitalize() + '_current',
-            where=sciSql
+        statement = 'taxon_by_namegroup_' + table.lower()
+        self.statements.register(
+            statement,
+            ['text'],
+            "SELECT rec "
+            "FROM {table} "
+            "WHERE rec->'acceptedName'->>'scientificNameGroup' = $1".format(
+                table=table.capitalize() + '_current'
+            )
         )
 
         taxons = []
         with self.db.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query)
+                self.statements.execute(cursor, statement, scientificNameGroup)
                 logger.debug('get_taxon: {taxonkey} store json in cache'.format(
                     taxonkey=taxonKey
                 ))
@@ -1585,6 +2610,60 @@ class Percolator:
 
         return taxons
 
+    @db_session
+    def preload_taxa(self):
+        """
+        Fills the in memory taxon cache with the taxa of all sources
+        used for enrichment, each taxon table is read in a single
+        streaming query
+        """
+        taxonSources = []
+        for sourceConfig in self.config.get('sources').values():
+            for source in sourceConfig.get('src-enrich') or []:
+                if source not in taxonSources:
+                    taxonSources.append(source)
+
+        for source in taxonSources:
+            sourceConfig = self.config.get('sources').get(source, False)
+            if not sourceConfig or not sourceConfig.get('table'):
+                continue
+
+            lap = timer()
+            code = sourceConfig.get('code')
+            query = "SELECT rec->'acceptedName'->>'scientificNameGroup', rec " \
+                    "FROM {table}_current " \
+                    "WHERE rec->'acceptedName'->>'scientificNameGroup' IS NOT NULL " \
+                    "ORDER BY 1".format(table=sourceConfig.get('table'))
+
+            count = 0
+            full = False
+            with self.db.get_connection() as conn:
+                with conn.cursor(name='preload_taxa') as cursor:
+                    cursor.itersize = 10000
+                    cursor.execute(query)
+
+                    scientificNameGroup = None
+                    taxons = []
+                    for row in cursor:
+                        if row[0] != scientificNameGroup and taxons:
+                            if not cache.preload(cache.key(code, scientificNameGroup), taxons):
+                                full = True
+                                break
+                            count += 1
+                            taxons = []
+                        scientificNameGroup = row[0]
+                        taxons.append(row[1])
+
+                    if taxons and not full and cache.preload(cache.key(code, scientificNameGroup), taxons):
+                        count += 1
+
+            logger.info('[{elapsed:.2f} seconds] Preloaded {count} taxa of "{source}"{full}'.format(
+                elapsed=(timer() - lap),
+                count=count,
+                source=source,
+                full=' (cache is full)' if full else ''
+            ))
+
     def cache_taxon_record(self, jsonRec, systemCode):
         """
         Caches the taxon record
@@ -1595,18 +2674,18 @@ class Percolator:
         taxons = []
         if jsonRec.get('acceptedName') and jsonRec.get('acceptedName').get('scientificNameGroup'):
             scientificNameGroup = jsonRec.get('acceptedName').get('scientificNameGroup')
-            taxonKey = '_'.join([systemCode, scientificNameGroup])
+            taxonKey = cache.key(systemCode, scientificNameGroup)
 
             cachedTaxons = cache.get(taxonKey)
             if cachedTaxons:
                 for jsonTaxon in cachedTaxons:
-                    taxon = json.loads(jsonTaxon)
+                    taxon = codec.loads(jsonTaxon)
                     if taxon.get('id') == jsonRec.get('id'):
-                        taxons.append(json.dumps(jsonRec))
+                        taxons.append(codec.dumps(jsonRec))
                     else:
                         taxons.append(jsonTaxon)
             else:
-                taxons.append(json.dumps(jsonRec))
+                taxons.append(codec.dumps(jsonRec))
 
             logger.debug('cache_taxon_records: {taxonkey} store json in cache'.format(
                     taxonkey=taxonKey
@@ -1614,6 +2693,31 @@ class Percolator:
             )
             cache.set(taxonKey, taxons)
 
+    def uncache_taxon_record(self, jsonRec, systemCode):
+        """
+        Removes a (deleted) taxon record from the cache
+
+        :param jsonRec:
+        :param systemCode:
+        """
+        if jsonRec.get('acceptedName') and jsonRec.get('acceptedName').get('scientificNameGroup'):
+            scientificNameGroup = jsonRec.get('acceptedName').get('scientificNameGroup')
+            taxonKey = cache.key(systemCode, scientificNameGroup)
+
+            cachedTaxons = cache.get(taxonKey)
+            if cachedTaxons is not None:
+                taxons = []
+                for jsonTaxon in cachedTaxons:
+                    taxon = codec.loads(jsonTaxon)
+                    if taxon.get('id') != jsonRec.get('id'):
+                        taxons.append(jsonTaxon)
+
+                logger.debug('uncache_taxon_record: {taxonkey} remove json from cache'.format(
+                        taxonkey=taxonKey
+                    )
+                )
+                cache.set(taxonKey, taxons)
+
     def create_name_summary(self, vernacularName):
         """
         Creates a scientific name summary, only use the fields specified
@@ -1666,7 +2770,7 @@ class Percolator:
         enrichments = []
         for jsonRec in taxonRecs:
             lap = timer()
-            rec = json.loads(jsonRec)
+            rec = codec.loads(jsonRec)
             vernacularNames = rec.get('vernacularNames')
             scientificNameGroup = rec.get('acceptedName').get('scientificNameGroup')
             enrichment = {}
@@ -1736,10 +2840,22 @@ class Percolator:
         :return enrichment(dictionary) or False:
         """
         lap = timer()
+
+        taxonKey = None
+        sourceConfig = self.config.get('sources').get(source, False)
+        if sourceConfig and sourceConfig.get('code'):
+            taxonKey = cache.key(sourceConfig.get('code'), sciNameGroup)
+            enrichments = cache.get_enrichments(taxonKey)
+            if enrichments is not None:
+                # the enrichments are shared, a copy of the list is enough
+                # because the records are only serialized
+                return list(enrichments) if enrichments else False
+
         taxons = self.get_taxon(sciNameGroup, source)
 
+        enrichments = False
         if taxons:
-            return self.create_enrichments(taxons, source)
+            enrichments = self.create_enrichments(taxons, source)
         else:
             logger.debug(
                 '[{elapsed:.2f} seconds] No enrichment for "{scinamegroup}" in "{source}"'.format(
@@ -1748,7 +2864,134 @@ class Percolator:
                     scinamegroup=sciNameGroup
                 )
             )
-            return False
+
+        if taxonKey:
+            cache.set_enrichments(taxonKey, enrichments or [])
+            if enrichments:
+                return list(enrichments)
+
+        return enrichments
+
+    def read_records(self, cursor, enrichSources=None):
+        """
+        Reads json records from a cursor in blocks, when enrichment
+        sources are given every block is enriched at once (see
+        enrich_records)
+
+        :param cursor:
+        :param enrichSources:
+        :return generator:
+        """
+        batchSize = int(self.get_setting('batch-size', 10000))
+        while True:
+            rows = cursor.fetchmany(batchSize)
+            if not rows:
+                break
+
+            records = [codec.loads(row[0]) for row in rows]
+            if enrichSources:
+                records = self.enrich_records(records, enrichSources)
+
+            for record in records:
+                yield record
+
+    def read_changes(self, cursor, changes, enrichSources=None):
+        """
+        Reads the import records of changes in blocks, every block is
+        retrieved with a single query and enriched at once (see
+        enrich_records)
+
+        :param cursor:
+        :param changes: lists of database ids, the first is the id in the import table
+        :param enrichSources:
+        :return generator: pairs of the database ids and the json record of a change
+        """
+        batchSize = int(self.get_setting('batch-size', 10000))
+        importsql = 'SELECT id, rec FROM {table}_import WHERE id = ANY(%s)'.format(
+            table=self.sourceConfig.get('table').capitalize()
+        )
+
+        changes = list(changes)
+        for offset in range(0, len(changes), batchSize):
+            block = changes[offset:offset + batchSize]
+            cursor.execute(importsql, ([databaseIds[0] for databaseIds in block],))
+            rows = dict(cursor.fetchall())
+
+            block = [databaseIds for databaseIds in block if databaseIds[0] in rows]
+            records = [codec.loads(rows[databaseIds[0]]) for databaseIds in block]
+            if enrichSources:
+                records = self.enrich_records(records, enrichSources)
+
+            for databaseIds, record in zip(block, records):
+                yield databaseIds, record
+
+    def load_taxa(self, scientificNameGroups, source):
+        """
+        Retrieves the taxa of all scientificNameGroups which are not
+        cached yet with a single query, and stores them in the cache
+
+        :param scientificNameGroups:
+        :param source:
+        """
+        sourceConfig = self.config.get('sources').get(source, False)
+        if not sourceConfig or not sourceConfig.get('table'):
+            return
+
+        lap = timer()
+        code = sourceConfig.get('code')
+        missing = [
+            scientificNameGroup for scientificNameGroup in scientificNameGroups
+            if cache.get(cache.key(code, scientificNameGroup)) is None
+        ]
+        if not missing:
+            return
+
+        query = "SELECT rec->'acceptedName'->>'scientificNameGroup', rec " \
+                "FROM {table}_current " \
+                "WHERE rec->'acceptedName'->>'scientificNameGroup' = ANY(%s)".format(
+            table=sourceConfig.get('table')
+        )
+
+        taxa = dict((scientificNameGroup, []) for scientificNameGroup in missing)
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, (missing,))
+                for row in cursor:
+                    taxa[row[0]].append(row[1])
+
+        for scientificNameGroup, taxons in taxa.items():
+            cache.set(cache.key(code, scientificNameGroup), taxons)
+
+        logger.debug('[{elapsed:.2f} seconds] Loaded taxa of {count} scientificNameGroups of "{source}"'.format(
+            elapsed=(timer() - lap),
+            count=len(missing),
+            source=source
+        ))
+
+    def enrich_records(self, records, sources):
+        """
+        Enriches a block of json records. All distinct
+        scientificNameGroups of the block are collected first, the
+        taxa that are not cached yet are retrieved with a single
+        query per source. After that every record is enriched from
+        the cache.
+
+        :param records:
+        :param sources:
+        :return list:
+        """
+        scientificNameGroups = set()
+        for rec in records:
+            for identification in rec.get('identifications') or []:
+                scientificName = identification.get('scientificName') or {}
+                if scientificName.get('scientificNameGroup'):
+                    scientificNameGroups.add(scientificName.get('scientificNameGroup'))
+
+        if scientificNameGroups:
+            for source in sources:
+                self.load_taxa(scientificNameGroups, source)
+
+        return [self.enrich_record(rec, sources) for rec in records]
 
     def enrich_record(self, rec, sources):
         """
@@ -1783,85 +3026,334 @@ class Percolator:
 
         return rec
 
-    @db_session
     def handle_impacted(self, source, record):
         """
-        Handles the record that are impacted by a taxon record change
+        Registers the scientificNameGroup of a changed taxon record,
+        the records of the source that are impacted by it are
+        enriched again once, at the end of the job (see
+        process_impacted)
 
         :param source:
         :param record:
         """
         scientificNameGroup = None
-        sourceConfig = self.config.get('sources').get(source)
-        enrichmentSources = sourceConfig.get('src-enrich', False)
-        idField = sourceConfig.get('id')
-        index = sourceConfig.get('index', 'noindex')
-
-        lap = start = timer()
 
         # Retrieve scientificNameGroup from the acceptedName part
         if record.get('acceptedName'):
             scientificNameGroup = record.get('acceptedName').get('scientificNameGroup')
 
         if scientificNameGroup:
-            impactedRecords = self.list_impacted(sourceConfig, scientificNameGroup)
-            if impactedRecords:
-                deltaFile = self.open_deltafile('enrich', index)
-                if deltaFile:
-                    for impacted in impactedRecords:
-                        jsonRecord = json.loads(impacted[1])
-                        if enrichmentSources:
-                            jsonRecord = self.enrich_record(jsonRecord, enrichmentSources)
-
-                        json.dump(jsonRecord, deltaFile)
+            self.impacted.setdefault(source, set()).add(scientificNameGroup)
+
+    @db_session
+    def process_impacted(self):
+        """
+        Handles the records that are impacted by the taxon record
+        changes of the whole job. For every source the union of
+        impacted records is retrieved in one query, every record is
+        enriched with the final state of the taxa and written once to
+        the enrich delta file.
+        """
+        for source, scientificNameGroups in self.impacted.items():
+            sourceConfig = self.config.get('sources').get(source)
+            if not sourceConfig:
+                continue
+
+            table = sourceConfig.get('table')
+            enrichmentSources = sourceConfig.get('src-enrich', False)
+            idField = sourceConfig.get('id')
+            index = sourceConfig.get('index', 'noindex')
+
+            start = timer()
+
+            patterns = [
+                codec.dumps([{'scientificName': {'scientificNameGroup': scientificNameGroup}}])
+                for scientificNameGroup in scientificNameGroups
+            ]
+            impactedsql = 'SELECT {table}_current.rec ' \
+                          'FROM {table}_current ' \
+                          'WHERE {table}_current.id IN (' \
+                          'SELECT impacted.id ' \
+                          'FROM unnest(%s::jsonb[]) AS namegroups(pattern) ' \
+                          'JOIN {table}_current impacted ' \
+                          'ON impacted.rec->\'identifications\' @> namegroups.pattern' \
+                          ') ORDER BY {table}_current.id'.format(table=table)
+
+            count = 0
+            deltaFile = None
+            with self.db.get_connection() as conn:
+                # held over commits of the taxon lookups on this connection
+                with conn.cursor(name='process_impacted', withhold=True) as cursor:
+                    cursor.execute(impactedsql, (patterns,))
+                    for jsonRecord in self.read_records(cursor, enrichmentSources):
+                        if not deltaFile:
+                            deltaFile = self.open_deltafile('enrich', index)
+
+                        codec.dump(jsonRecord, deltaFile)
                         deltaFile.write('\n')
+                        count += 1
 
-                        impactId = jsonRecord.get(idField)
-                        logger.debug(
-                            '[{elapsed:.2f} seconds] Record "{recordid}" of "{source}" needs to be enriched'.format(
-                                source=source,
-                                elapsed=(timer() - lap),
-                                recordid=impactId
-                            )
-                        )
                         self.log_change(
                             state='enrich',
-                            recid=impactId,
+                            recid=jsonRecord.get(idField),
                             source=sourceConfig.get('code'),
                             type=index
                         )
-                        lap = timer()
 
-                    meta = self.get_metainfo(key='enrich:' + index)
-                    if isinstance(meta, dict):
-                        meta['count'] += len(impactedRecords)
-                        meta['elapsed'] += timer() - start
-                    else:
-                        meta = {
-                            'count': len(impactedRecords),
-                            'file': deltaFile.name,
-                            'elapsed': timer() - start
-                        }
+            logger.info(
+                '[{elapsed:.2f} seconds] Enriched {count} records in {source} impacted by '
+                '{namegroups} scientificNameGroups'.format(
+                    elapsed=(timer() - start),
+                    count=count,
+                    source=source,
+                    namegroups=len(scientificNameGroups)
+                )
+            )
 
-                    self.set_metainfo(key='enrich:' + index, value=meta)
+            if deltaFile:
+                meta = {
+                    'count': count,
+                    'file': deltaFile.name,
+                    'elapsed': timer() - start
+                }
+                # the impacted records do not belong to one of the imported
+                # files, in lanes the percolator has no source or file either
+                self.set_metainfo(key='enrich:' + index, value=meta, source=source, filename='impacted')
 
-                    deltaFile.close()
+        self.impacted = {}
 
-    @db_session
     def handle_changes(self):
         """
-        Handles all the changes
+        Handles all the changes. When a source is configured with
+        more than one partition, the changes are handled by a worker
+        process per partition (see handle_partitioned_changes).
         """
+        partitions = int(self.get_setting('partitions', 1))
+        if partitions > 1 and self.partition is None:
+            self.handle_partitioned_changes(partitions)
+            self.bump_generation()
+            return
 
         self.list_changes()
 
         if len(self.changes['new']):
-            self.handle_new()
+            if self.is_enabled('bulk') or self.is_passthrough():
+                self.handle_new_bulk()
+            else:
+                self.handle_new()
         if len(self.changes['update']):
-            self.handle_updates()
+            if self.is_enabled('bulk') or self.is_passthrough():
+                self.handle_updates_bulk()
+            else:
+                self.handle_updates()
         if not self.is_incremental():
             # Only deletes in case a source supplies complete sets
             if (len(self.changes['delete'])):
-                self.handle_deletes()
+                if self.is_enabled('bulk'):
+                    self.handle_deletes_bulk()
+                else:
+                    self.handle_deletes()
+
+        # the partitioned parent bumps the generation once for all partitions
+        if self.partition is None and any(len(changes) for changes in self.changes.values()):
+            self.bump_generation()
 
         return
+
+    def partition_filter(self, expression):
+        """
+        Returns the sql condition which limits a query to the
+        partition of this worker, based on the hash of the record id
+        expression
+
+        :param expression:
+        :return:
+        """
+        if self.partition is None:
+            return ''
+
+        return ' AND (hashtext({expression}) & 2147483647) % {count} = {number}'.format(
+            expression=expression,
+            number=self.partition[0],
+            count=self.partition[1]
+        )
+
+    def handle_partitioned_changes(self, partitions):
+        """
+        Splits the changes of a source in partitions on the hash of
+        the record id. Each partition is diffed and handled by a
+        separate worker process with its own database connection,
+        the partial delta files are merged afterwards.
+
+        :param partitions:
+        """
+        start = timer()
+        logger.info('Handling changes of "{source}" in {partitions} partitions'.format(
+            source=self.source,
+            partitions=partitions
+        ))
+
+        # database and logging connections can not be shared with forked processes
+        if self.changeLogger:
+            self.changeLogger.flush()
+        self.db.disconnect()
+
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes=partitions, initializer=init_worker, initargs=(self, self.source)) as pool:
+            results = pool.map(handle_partition, [(number, partitions) for number in range(partitions)])
+
+        for meta, shards, impacted in results:
+            self.merge_partition(meta, shards)
+            self.merge_impacted(impacted)
+
+        self.set_indexes(self.sourceConfig.get('table') + '_current')
+
+        logger.info('[{elapsed:.2f} seconds] Handled changes of "{source}" in {partitions} partitions'.format(
+            source=self.source,
+            partitions=partitions,
+            elapsed=(timer() - start)
+        ))
+
+    def merge_partition(self, meta, shards):
+        """
+        Merges the job results and delta files of a partition. When
+        the delta files are rotated, the shards of the partition are
+        kept as they are. Otherwise every partial delta file is
+        appended to the delta file of the job (compressed streams can
+        be concatenated).
+
+        :param meta:
+        :param shards: manifest entries of the delta files of the partition
+        """
+        settings = self.get_delta_settings()
+        rotating = settings.get('maxRecords') or settings.get('maxBytes')
+
+        for entry in shards:
+            partFile = entry.get('file')
+            if rotating:
+                self.deltaShards[partFile] = entry
+                continue
+
+            filePath = re.sub(r'-part\d+(\.json(\.gz|\.zst)?)$', r'\1', partFile)
+
+            # a writer of the same delta file can not be left halfway a compressed stream
+            self.close_deltafile(entry.get('index'), entry.get('action'))
+            info = self.deltaShards.get(filePath)
+            mode = 'ab'
+            if info is None:
+                # a temporary file of an earlier run is overwritten
+                mode = 'wb'
+                info = dict(entry, file=filePath, count=0, size=0, bytes=0, hash=hashlib.sha256())
+                info.pop('sha256', None)
+                self.deltaShards[filePath] = info
+
+            with open(temporary_path(filePath), mode) as deltaFile, open(partFile, 'rb') as partialFile:
+                for chunk in iter(lambda: partialFile.read(1048576), b''):
+                    deltaFile.write(chunk)
+                    info['hash'].update(chunk)
+                    info['bytes'] += len(chunk)
+            info['count'] += entry.get('count', 0)
+            info['size'] += entry.get('size', 0)
+            os.remove(partFile)
+
+        for source, files in meta.items():
+            for filename, info in files.items():
+                for key, value in info.items():
+                    if isinstance(value, dict) and value.get('file') and not rotating:
+                        value['file'] = re.sub(r'-part\d+(\.json(\.gz|\.zst)?)$', r'\1', value['file'])
+
+                    current = self.get_metainfo(key=key, source=source, filename=filename)
+                    if isinstance(current, dict) and isinstance(value, dict):
+                        current['count'] = current.get('count', 0) + value.get('count', 0)
+                        current['elapsed'] = max(current.get('elapsed', 0), value.get('elapsed', 0))
+                    else:
+                        self.set_metainfo(key=key, value=value, source=source, filename=filename)
+
+
+# The percolator of the main process and the source of a partition or export
+# worker process, set by init_worker in the (forked) worker only, so lanes
+# of the main process do not share it
+workerSetup = None
+
+
+def init_worker(percolator, source):
+    """
+    Initializes a partition or export worker process. The signal
+    handlers of the daemon are not inherited, so terminating the
+    pool stops the workers.
+
+    :param percolator: percolator of the main process
+    :param source:
+    """
+    global workerSetup
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    workerSetup = (percolator, source)
+
+
+def create_worker():
+    """
+    Returns a worker percolator for a task of a worker process
+
+    :return Percolator:
+    """
+    percolator, source = workerSetup
+    worker = percolator.create_worker()
+    worker.set_source(source)
+    return worker
+
+
+def handle_partition(partition):
+    """
+    Handles the changes of a single partition in a worker process
+
+    :param partition: tuple of partition number and count
+    :return tuple: metainfo, delta file manifest and impacted scientificNameGroups of the partition
+    """
+    worker = create_worker()
+    worker.partition = partition
+
+    # connections of the main process are not used after the fork
+    cache.close()
+    worker.es = worker.connect_to_elastic()
+    worker.changeLogger = worker.create_changelogger()
+
+    worker.handle_changes()
+    worker.publish_deltafiles()
+
+    if worker.changeLogger:
+        worker.changeLogger.close()
+
+    return worker.percolatorMeta, manifest(worker.deltaShards), worker.impacted
+
+
+def export_shard(shard):
+    """
+    Exports a single shard (id range) of a source in a worker process
+
+    :param shard: tuple of shard number, file path and the id range
+    :return dict: shard info for the manifest
+    """
+    number, filePath, low, high = shard
+    worker = create_worker()
+
+    # connections of the main process are not used after the fork
+    cache.close()
+
+    start = timer()
+    with open(filePath, 'w', encoding='utf-8') as fp:
+        count = worker.export_records(fp, idRange=(low, high))
+
+    logger.debug('[{elapsed:.2f} seconds] Exported {count} records to "{file}"'.format(
+        elapsed=(timer() - start),
+        count=count,
+        file=filePath
+    ))
+
+    return {
+        'shard': number,
+        'file': filePath,
+        'count': count,
+        'ids': [low, high]
+    }
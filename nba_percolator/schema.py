@@ -165,7 +165,7 @@ class Testmedia_current(db.Entity):
 
 
 class Deleted_records(db.Entity):
-    recid = Required(str, index=True)
+    recid = Required(str, unique=True)
     status = Required(str, index=True)
     count = Required(int, sql_default=1)
     datum = Required(datetime, sql_default='now()')
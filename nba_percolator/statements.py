@@ -0,0 +1,105 @@
+"""Server side prepared statements for the NBA percolator
+
+The hot lookups (records by id, taxa and impacted records by
+scientificNameGroup) are prepared once per database connection. The
+connections themselves are kept open by the (per thread) connection
+pool of Pony, so the database can reuse the plans for every lookup.
+"""
+import logging
+import threading
+import weakref
+from psycopg2 import Error, errorcodes
+
+logger = logging.getLogger('nba_percolator')
+
+
+class Statements:
+    """
+    Registry of prepared statements. A registered statement is
+    prepared on a connection the first time it is executed there,
+    values are always passed as parameters. The statements prepared
+    on a connection are remembered for the connection object, they
+    are forgotten when the connection is gone.
+    """
+
+    def __init__(self):
+        self.definitions = {}
+        self.prepared = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    def register(self, name, types, query):
+        """
+        Registers a statement, the query uses $1, $2, .. for the
+        parameters of the given types
+
+        :param name:
+        :param types: list of postgres types of the parameters
+        :param query:
+        """
+        if name not in self.definitions:
+            self.definitions[name] = (types, query)
+
+    def execute(self, cursor, name, *params):
+        """
+        Executes a registered statement, prepares it first when the
+        connection of the cursor does not know it yet. When the
+        session lost the statement anyway, the failed transaction is
+        rolled back and the statement is prepared and executed again.
+
+        :param cursor:
+        :param name:
+        :param params:
+        """
+        try:
+            self.execute_prepared(cursor, name, params)
+        except Error as error:
+            if error.pgcode != errorcodes.INVALID_SQL_STATEMENT_NAME:
+                raise
+
+            logger.warning('Prepared statement "{name}" is gone, preparing it again'.format(name=name))
+            # the transaction is aborted by the error, the statements the
+            # session does have are read again
+            connection = cursor.connection
+            connection.rollback()
+            with self.lock:
+                self.prepared.pop(connection, None)
+            self.execute_prepared(cursor, name, params)
+
+    def get_prepared(self, cursor):
+        """
+        Returns the names of the statements prepared on the connection
+        of the cursor
+
+        :param cursor:
+        :return set:
+        """
+        connection = cursor.connection
+        with self.lock:
+            prepared = self.prepared.get(connection)
+        if prepared is None:
+            # a pooled connection can already have prepared statements
+            cursor.execute('SELECT name FROM pg_prepared_statements')
+            prepared = set(row[0] for row in cursor.fetchall())
+            with self.lock:
+                self.prepared[connection] = prepared
+        return prepared
+
+    def execute_prepared(self, cursor, name, params):
+        prepared = self.get_prepared(cursor)
+        if name not in prepared:
+            types, query = self.definitions[name]
+            cursor.execute('PREPARE {name} ({types}) AS {query}'.format(
+                name=name,
+                types=', '.join(types),
+                query=query
+            ))
+            prepared.add(name)
+            logger.debug('Prepared statement "{name}"'.format(name=name))
+
+        cursor.execute(
+            'EXECUTE {name} ({placeholders})'.format(
+                name=name,
+                placeholders=', '.join(['%s'] * len(params))
+            ),
+            params
+        )
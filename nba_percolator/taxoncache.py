@@ -0,0 +1,206 @@
+"""Taxon cache for the NBA percolator
+
+Taxon records used for enrichment are cached in two tiers: an in
+memory LRU tier in front of the (sqlite based) disk cache. The
+enrichments derived from the taxon records are memoized in memory.
+
+The disk cache is kept between runs. Keys contain the generation of
+the taxon source, which is raised whenever the current table of the
+source changes, so entries of an older state of the taxa are never
+used again and are evicted from disk eventually. Keys also contain
+the identity of the database, generations of another (or a recreated)
+database start at the same numbers.
+"""
+import threading
+from collections import OrderedDict
+from diskcache import Cache
+
+
+class TaxonCache:
+    """
+    In memory LRU cache in front of a diskcache Cache. Values that
+    are found on disk are kept in memory as well, the least recently
+    used values are evicted from memory when it is full.
+    """
+
+    def __init__(self, disk=None, size=100000):
+        self.disk = disk
+        self.size = size
+        self.memory = OrderedDict()
+        self.enrichments = OrderedDict()
+        self.generations = {}
+        self.database = ''
+        self.lock = threading.Lock()
+        self.reset_statistics()
+
+    def open(self, directory, sizeLimit=2 ** 30, evictionPolicy='least-recently-used'):
+        """
+        Opens the disk cache, diskcache can be used by several
+        (forked) processes and threads at the same time
+
+        :param directory:
+        :param sizeLimit: maximum size on disk in bytes
+        :param evictionPolicy: eviction policy of diskcache
+        """
+        if self.disk is not None:
+            self.disk.close()
+
+        self.disk = Cache(directory, size_limit=sizeLimit, eviction_policy=evictionPolicy)
+
+    def key(self, code, scientificNameGroup):
+        """
+        Returns the cache key of a scientificNameGroup of a taxon
+        source, the key contains the database and the generation of
+        the source
+
+        :param code:
+        :param scientificNameGroup:
+        :return str:
+        """
+        return '_'.join([self.database, code, str(self.generations.get(code, 0)), scientificNameGroup])
+
+    def set_database(self, identity):
+        """
+        Sets the identity of the database the taxa are read from
+
+        :param identity:
+        """
+        self.database = identity
+
+    def set_generation(self, code, generation):
+        """
+        Sets the generation of a taxon source, keys of an older
+        generation are not used anymore
+
+        :param code:
+        :param generation:
+        """
+        self.generations[code] = generation
+
+    def reset_statistics(self):
+        self.stats = {
+            'memoryHits': 0,
+            'diskHits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+    def statistics(self):
+        """
+        Returns the hit, miss and eviction counters
+
+        :return dict:
+        """
+        stats = dict(self.stats)
+        stats['size'] = len(self.memory)
+        return stats
+
+    def get(self, key):
+        """
+        Gets a value from memory, or from disk when it is not in
+        memory. Returns None when the key is not cached.
+
+        :param key:
+        :return:
+        """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.stats['memoryHits'] += 1
+                return self.memory[key]
+
+        value = self.disk.get(key)
+        if value is None:
+            with self.lock:
+                self.stats['misses'] += 1
+            return None
+
+        with self.lock:
+            self.stats['diskHits'] += 1
+        # a value that is set while reading from disk is newer
+        return self.remember(key, value, replace=False)
+
+    def set(self, key, value):
+        """
+        Stores a value in memory and on disk, the enrichments derived
+        from the previous value are forgotten
+
+        :param key:
+        :param value:
+        """
+        self.remember(key, value)
+        self.disk.set(key, value)
+        with self.lock:
+            self.enrichments.pop(key, None)
+
+    def get_enrichments(self, key):
+        """
+        Gets the memoized enrichments of a key, returns None when
+        they are not memoized
+
+        :param key:
+        :return:
+        """
+        with self.lock:
+            if key in self.enrichments:
+                self.enrichments.move_to_end(key)
+                return self.enrichments[key]
+        return None
+
+    def set_enrichments(self, key, enrichments):
+        """
+        Memoizes the enrichments derived from the value of a key
+
+        :param key:
+        :param enrichments:
+        """
+        with self.lock:
+            self.enrichments[key] = enrichments
+            self.enrichments.move_to_end(key)
+            while len(self.enrichments) > self.size:
+                self.enrichments.popitem(last=False)
+
+    def preload(self, key, value):
+        """
+        Stores a value in memory only, used for warming the cache
+
+        :param key:
+        :param value:
+        :return bool: False when memory is full
+        """
+        if len(self.memory) >= self.size:
+            return False
+
+        self.remember(key, value)
+        with self.lock:
+            self.enrichments.pop(key, None)
+        return True
+
+    def remember(self, key, value, replace=True):
+        """
+        Stores a value in memory, evicts the least recently used
+        values when memory is full
+
+        :param key:
+        :param value:
+        :param replace: False keeps a value that is already in memory
+        :return: the value in memory
+        """
+        with self.lock:
+            if replace or key not in self.memory:
+                self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.size:
+                self.memory.popitem(last=False)
+                self.stats['evictions'] += 1
+            return self.memory.get(key, value)
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.enrichments.clear()
+        self.disk.clear()
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,56 @@
+"""Watching of the jobs directory for the percolator daemon
+
+With the inotify_simple module the daemon is woken up as soon as a job
+file is written or moved into the jobs directory. Without it, the jobs
+directory is polled.
+"""
+import logging
+import threading
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+logger = logging.getLogger('nba_percolator')
+
+
+class JobWatcher:
+    """
+    Waits for new job files, at most for the interval, so the daemon
+    also picks up jobs it could not start before (e.g. when another
+    percolator held the lock)
+    """
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+        self.inotify = None
+        if INotify is not None:
+            self.inotify = INotify()
+            self.inotify.add_watch(path, flags.CLOSE_WRITE | flags.MOVED_TO)
+            logger.debug('Watching "{path}" with inotify'.format(path=path))
+        else:
+            logger.debug('Polling "{path}" every {interval} seconds'.format(path=path, interval=interval))
+
+    def wait(self):
+        """
+        Waits until a job file is written, the interval has passed
+        or the watcher is stopped
+        """
+        if self.inotify is not None:
+            self.inotify.read(timeout=int(self.interval * 1000))
+        else:
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+
+    def is_stopped(self):
+        return self.stopped.is_set()
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
@@ -0,0 +1,34 @@
+import unittest
+from unittest import mock
+from nba_percolator.changelog import ChangeLogger
+
+
+class ChangeLoggerTestCase(unittest.TestCase):
+
+    def test_flush_in_batches(self):
+        sizes = []
+        with mock.patch('nba_percolator.changelog.bulk', lambda es, actions, **kwargs: (sizes.append(len(actions)) or (len(actions), []))):
+            changeLogger = ChangeLogger(None, bulkSize=500, flushInterval=60, queueSize=10000)
+            for number in range(3000):
+                changeLogger.log('test', str(number), {})
+            changeLogger.flush()
+            changeLogger.close()
+
+        self.assertEqual(sum(sizes), 3000)
+        self.assertLessEqual(len(sizes), 7)
+
+    def test_failing_bulk(self):
+        def failing(es, actions, **kwargs):
+            raise RuntimeError('down')
+
+        with mock.patch('nba_percolator.changelog.bulk', failing):
+            changeLogger = ChangeLogger(None, bulkSize=10, flushInterval=60, queueSize=20)
+            for number in range(100):
+                changeLogger.log('test', str(number), {})
+            changeLogger.flush()
+            self.assertTrue(changeLogger.thread.is_alive())
+            changeLogger.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+from unittest import mock
+from nba_percolator import codec
+
+
+class CodecTestCase(unittest.TestCase):
+
+    def test_backends_identical(self):
+        record = {'id': 'L.1@CRS', 'name': 'é', 'numbers': [1, 2.5], 'preferred': True, 'none': None}
+        dumped = codec.dumps(record)
+        with mock.patch.object(codec, 'orjson', None):
+            self.assertEqual(codec.dumps(record), dumped)
+        self.assertEqual(dumped, '{"id":"L.1@CRS","name":"é","numbers":[1,2.5],"preferred":true,"none":null}')
+
+
+if __name__ == '__main__':
+    unittest.main()
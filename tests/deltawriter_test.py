@@ -0,0 +1,79 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import unittest
+from nba_percolator.deltawriter import DeltaWriter, manifest, temporary_path
+
+
+class DeltaWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.directory.name, 'job-specimen-new')
+        self.shards = {}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def publish(self):
+        for path in self.shards:
+            os.replace(temporary_path(path), path)
+
+    def test_temporary(self):
+        writer = DeltaWriter(self.base, self.shards)
+        writer.write('{"id": "1"}\n')
+        writer.close()
+
+        self.assertFalse(os.path.isfile(writer.name))
+        self.assertTrue(os.path.isfile(temporary_path(writer.name)))
+
+    def test_rotation(self):
+        writer = DeltaWriter(self.base, self.shards, compression='gzip', maxRecords=2)
+        for number in range(5):
+            writer.write('{"id": "%d"}' % number)
+            writer.write('\n')
+        writer.close()
+        self.publish()
+
+        entries = manifest(self.shards)
+        self.assertEqual([entry.get('count') for entry in entries], [2, 2, 1])
+        self.assertTrue(entries[2].get('file').endswith('-shard2.json.gz'))
+        with gzip.open(entries[2].get('file'), 'rt') as fp:
+            self.assertEqual(fp.read(), '{"id": "4"}\n')
+
+    def test_checksum(self):
+        writer = DeltaWriter(self.base, self.shards)
+        writer.write('{"id": "1"}\n')
+        writer.close()
+
+        # a delta file opened again in the same job is appended
+        writer = DeltaWriter(self.base, self.shards)
+        writer.write('{"id": "2"}\n')
+        writer.close()
+        self.publish()
+
+        entry = manifest(self.shards)[0]
+        with open(entry.get('file'), 'rb') as fp:
+            self.assertEqual(hashlib.sha256(fp.read()).hexdigest(), entry.get('sha256'))
+        self.assertEqual(entry.get('count'), 2)
+
+    def test_stale_temporary(self):
+        # left by a job that failed before publishing
+        with open(temporary_path(self.base + '.json'), 'w') as fp:
+            fp.write('{"id": "0"}\n')
+
+        writer = DeltaWriter(self.base, self.shards)
+        writer.write('{"id": "1"}\n')
+        writer.close()
+        self.publish()
+
+        entry = manifest(self.shards)[0]
+        with open(entry.get('file'), 'rb') as fp:
+            data = fp.read()
+        self.assertEqual(data, b'{"id": "1"}\n')
+        self.assertEqual(hashlib.sha256(data).hexdigest(), entry.get('sha256'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import unittest
+import logging
+from nba_percolator import Percolator
+
+
+class JobsTestCase(unittest.TestCase):
+
+    config = {
+        'elastic': {
+            'host': 'elasticsearch'
+        },
+        'paths': {
+            'incoming': '/shared-data/incoming',
+            'processed': '/shared-data/processed',
+            'jobs': '/shared-data/jobs',
+            'failed': '/shared-data/failed',
+            'done': '/shared-data/done',
+            'delta': '/shared-data/incremental'
+        },
+        'workers': 2,
+        'sources':
+            {
+                'nsr-taxa':
+                    {
+                        'table': 'nsrtaxa',
+                        'id': 'id',
+                        'code': 'NSR',
+                        'index': 'taxon',
+                        'incremental': False
+                    },
+                'brahms-specimen':
+                    {
+                        'table': 'brahmsspecimen',
+                        'id': 'id',
+                        'index': 'specimen',
+                        'src-enrich': ['nsr-taxa'],
+                        'incremental': False
+                    },
+                'brahms-multimedia':
+                    {
+                        'table': 'brahmsmedia',
+                        'id': 'id',
+                        'index': 'multimedia',
+                        'src-enrich': ['nsr-taxa'],
+                        'incremental': False
+                    }
+            },
+        'postgres':
+            {
+                'host': 'postgres',
+                'user': 'postgres',
+                'pass': 'postgres',
+                'db': 'ppdb'
+            }
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(JobsTestCase, self).__init__(*args, **kwargs)
+        logger = logging.getLogger('nba_percolator')
+        logger.setLevel(logging.ERROR)
+        self.pp = Percolator(config=self.config)
+        self.pp.set_nologging()
+        self.pp.noslack = True
+        try:
+            self.pp.generate_mapping(create_tables=True)
+        except Exception:
+            pass
+
+    def setUp(self):
+        self.pp.clear_data(table='brahmsspecimen_current')
+        self.pp.clear_data(table='brahmsmedia_current')
+
+    def write_job(self, jobId, datafile):
+        """
+        Writes a job with the datafile for both brahms sources
+        """
+        validator = {}
+        for key in ['specimen', 'multimedia']:
+            filename = '{job}-{key}.json'.format(job=jobId, key=key)
+            shutil.copy(os.path.join('/shared-data/test', datafile), self.pp.get_path('incoming', filename))
+            validator[key] = {'results': {'outfiles': {'valid': [filename]}}}
+
+        jobFile = self.pp.get_path('jobs', jobId + '.json')
+        with open(jobFile, 'w') as fp:
+            json.dump({
+                'id': jobId,
+                'data_supplier': 'brahms',
+                'date': '2018-01-01 00:10:20',
+                'validator': validator
+            }, fp)
+        return jobFile
+
+    def test_jobs_in_lanes(self):
+        # the lanes of the second job reuse the prepared statements of the first
+        for jobId, datafile in [('lanes-j1', '1-base.json'), ('lanes-j2', '4-updates.json')]:
+            jobFile = self.write_job(jobId, datafile)
+            try:
+                self.assertTrue(self.pp.handle_job(jobFile))
+            finally:
+                os.remove(jobFile)
+            self.assertTrue(os.path.isfile(self.pp.get_path('done', jobId + '.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import logging
+from nba_percolator import Percolator
+
+class LanesTestCase(unittest.TestCase):
+
+    config = {
+        'elastic': {
+            'host': 'elasticsearch'
+        },
+        'paths': {
+            'incoming': '/shared-data/incoming',
+            'processed': '/shared-data/processed',
+            'jobs': '/shared-data/jobs',
+            'failed': '/shared-data/failed',
+            'done': '/shared-data/done',
+            'delta': '/shared-data/incremental'
+        },
+        'workers': 4,
+        'sources':
+            {
+                'nsr-taxa':
+                    {
+                        'table': 'nsrtaxa',
+                        'id': 'id',
+                        'index': 'taxon',
+                        'incremental': False,
+                        'enriches': ['brahms-specimen']
+                    },
+                'brahms-specimen':
+                    {
+                        'table': 'brahmsspecimen',
+                        'id': 'id',
+                        'index': 'specimen',
+                        'incremental': False,
+                        'src-enrich': ['nsr-taxa']
+                    },
+                'brahms-multimedia':
+                    {
+                        'table': 'brahmsmedia',
+                        'id': 'id',
+                        'index': 'multimedia',
+                        'incremental': False,
+                        'src-enrich': ['nsr-taxa']
+                    },
+                'col-taxa':
+                    {
+                        'table': 'coltaxa',
+                        'id': 'id',
+                        'incremental': False
+                    },
+                'waarneming-multimedia':
+                    {
+                        'table': 'waarnemingmedia',
+                        'id': 'id',
+                        'incremental': False
+                    },
+                'crs-specimen':
+                    {
+                        'table': 'crsspecimen',
+                        'id': 'id',
+                        'index': 'specimen',
+                        'incremental': False
+                    }
+            },
+        'postgres':
+            {
+                'host': 'postgres',
+                'user': 'postgres',
+                'pass': 'postgres',
+                'db': 'ppdb'
+            }
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(LanesTestCase, self).__init__(*args, **kwargs)
+        logger = logging.getLogger('nba_percolator')
+        logger.setLevel(logging.ERROR)
+        self.pp = Percolator(config=self.config)
+
+    def test_independent_sources(self):
+        # both are enriched by nsr-taxa, which is not part of the job
+        lanes = self.pp.plan_lanes(['brahms-specimen', 'brahms-multimedia'])
+        self.assertEqual(len(lanes), 2)
+
+    def test_without_index(self):
+        lanes = self.pp.plan_lanes(['col-taxa', 'waarneming-multimedia'])
+        self.assertEqual(len(lanes), 2)
+
+    def test_same_index(self):
+        lanes = self.pp.plan_lanes(['brahms-specimen', 'crs-specimen', 'brahms-multimedia'])
+        self.assertEqual(len(lanes), 2)
+        self.assertIn(['brahms-specimen', 'crs-specimen'], lanes)
+
+    def test_enrichment_order(self):
+        lanes = self.pp.plan_lanes(['brahms-specimen', 'nsr-taxa'])
+        self.assertEqual(lanes, [['nsr-taxa', 'brahms-specimen']])
+
+
+if __name__ == '__main__':
+    unittest.main()
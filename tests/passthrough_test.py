@@ -0,0 +1,23 @@
+import io
+import unittest
+from nba_percolator.passthrough import Passthrough, copy_query
+
+
+class PassthroughTestCase(unittest.TestCase):
+
+    def test_rows(self):
+        fp = io.StringIO()
+        passthrough = Passthrough(fp)
+        passthrough.write('a1\x02{"id": "a1", "text": "x\\ny"}\n'.encode('utf-8'))
+        passthrough.write('b2\x02{"id": "b2", ')
+        passthrough.write('"name": "é"}\n')
+
+        self.assertEqual(passthrough.ids, ['a1', 'b2'])
+        self.assertEqual(fp.getvalue(), '{"id": "a1", "text": "x\\ny"}\n{"id": "b2", "name": "é"}\n')
+
+    def test_copy_query(self):
+        self.assertTrue(copy_query('SELECT 1').startswith('COPY (SELECT 1) TO STDOUT'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import tempfile
+from unittest import mock
+from diskcache import Cache
+from nba_percolator.taxoncache import TaxonCache
+
+class TaxonCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = TaxonCache(Cache(self.directory.name), size=2)
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_memory_hit(self):
+        self.cache.set('NSR_test', ['{"id": "test123"}'])
+        self.assertEqual(self.cache.get('NSR_test'), ['{"id": "test123"}'])
+        self.assertEqual(self.cache.statistics().get('memoryHits'), 1)
+
+    def test_eviction(self):
+        self.cache.set('NSR_a', ['a'])
+        self.cache.set('NSR_b', ['b'])
+        self.cache.get('NSR_a')
+        self.cache.set('NSR_c', ['c'])
+
+        stats = self.cache.statistics()
+        self.assertEqual(stats.get('evictions'), 1)
+        self.assertEqual(stats.get('size'), 2)
+
+        # the evicted value is still on disk
+        self.assertEqual(self.cache.get('NSR_b'), ['b'])
+        self.assertEqual(self.cache.statistics().get('diskHits'), 1)
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get('NSR_missing'))
+        self.assertEqual(self.cache.statistics().get('misses'), 1)
+
+    def test_set_while_reading(self):
+        self.cache.disk.set('NSR_a', ['old'])
+        read = self.cache.disk.get
+
+        def get(key):
+            value = read(key)
+            # the key is set by another thread while it is read from disk
+            self.cache.set(key, ['new'])
+            return value
+
+        with mock.patch.object(self.cache.disk, 'get', get):
+            self.assertEqual(self.cache.get('NSR_a'), ['new'])
+        self.assertEqual(self.cache.get('NSR_a'), ['new'])
+
+    def test_preload(self):
+        self.assertTrue(self.cache.preload('NSR_a', ['a']))
+        self.assertTrue(self.cache.preload('NSR_b', ['b']))
+        self.assertFalse(self.cache.preload('NSR_c', ['c']))
+        self.assertIsNone(self.cache.disk.get('NSR_a'))
+
+    def test_enrichments_invalidated(self):
+        self.cache.set('NSR_a', ['a'])
+        self.cache.set_enrichments('NSR_a', [{'taxonId': 'a'}])
+        self.assertEqual(self.cache.get_enrichments('NSR_a'), [{'taxonId': 'a'}])
+
+        self.cache.set('NSR_a', ['b'])
+        self.assertIsNone(self.cache.get_enrichments('NSR_a'))
+
+    def test_generation(self):
+        key = self.cache.key('NSR', 'test')
+        self.cache.set(key, ['{"id": "test123"}'])
+
+        self.cache.set_generation('NSR', 1)
+        self.assertNotEqual(self.cache.key('NSR', 'test'), key)
+        self.assertIsNone(self.cache.get(self.cache.key('NSR', 'test')))
+
+    def test_database(self):
+        key = self.cache.key('NSR', 'test')
+        self.cache.set(key, ['{"id": "test123"}'])
+
+        # taxa of another database are not used
+        self.cache.set_database('other')
+        self.assertNotEqual(self.cache.key('NSR', 'test'), key)
+        self.assertIsNone(self.cache.get(self.cache.key('NSR', 'test')))
+
+
+if __name__ == '__main__':
+    unittest.main()